@@ -0,0 +1,311 @@
+"""Month-end interest accrual and fee assessment for every account in one pass.
+
+Average daily balances, transaction counts and direct deposits come from a few
+aggregate queries; interest and fees are computed for all accounts at once with
+NumPy; the postings are written through ``ledger.post_transactions`` in chunks,
+one write transaction per chunk. Reference numbers are derived from the month
+and account, so running a month twice posts nothing the second time.
+
+    python accrual.py --db bank_transactions.db --month 2024-06
+"""
+import argparse
+import json
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import List, Optional
+
+import numpy as np
+
+import ledger
+from migrations import migrate
+
+# Tariff terms from rules.md section 9: monthly maintenance fee and the average
+# daily balance, relationship balance or direct deposits that waive it; minimum
+# balance for interest and bonus APY (%) tiers by relationship balance; the
+# excessive-transaction fee and the monthly count after which it applies.
+SCHEDULE = {
+    "NORMAL": dict(apy=0.05, interest_minimum=500, bonus=(), monthly_fee=12, balance_waiver=1500,
+                   relationship_waiver=None, direct_deposit_waiver=500, excess_after=15, excess_fee=1.50),
+    "BENEFIT": dict(apy=0.15, interest_minimum=1000, bonus=((50000, 0.05),), monthly_fee=25,
+                    balance_waiver=10000, relationship_waiver=25000, direct_deposit_waiver=None,
+                    excess_after=None, excess_fee=0.0),
+    "VIP": dict(apy=0.35, interest_minimum=0, bonus=((100000, 0.10), (500000, 0.15)), monthly_fee=0,
+                balance_waiver=None, relationship_waiver=None, direct_deposit_waiver=None,
+                excess_after=None, excess_fee=0.0),
+}
+TARIFF_NAMES = list(SCHEDULE)
+# Postings per write transaction, so the API's writer is never blocked for long
+CHUNK_SIZE = 2000
+# Transactions the bank posts itself; they don't count towards the excessive-transaction fee
+SYSTEM_TYPES = ("FEE", "INTEREST")
+
+_RATE = re.compile(r"^\s*([0-9]*\.?[0-9]+)\s*%?\s*$")
+
+_INSERT_FAILED = """
+    INSERT INTO transactions (
+        account_number, transaction_date, transaction_time, transaction_type, amount,
+        balance_after, description, reference_number, channel, status, failure_reason, created_at
+    ) VALUES (?, ?, ?, ?, ?, NULL, ?, ?, 'AUTO', 'FAILED', 'INSUFFICIENT_FUNDS', ?)
+"""
+
+
+def parse_rate(value) -> Optional[float]:
+    """APY in percent from ``clients.interest_rate``, stored as 0.05 or '0.05%'"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _RATE.match(value or "")
+    return float(match.group(1)) if match else None
+
+
+def month_bounds(month: str):
+    """First day of ``month`` (YYYY-MM) and of the month after it"""
+    start = datetime.strptime(month, "%Y-%m").date()
+    return start, (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def reference(kind: str, month: str, account_number: str) -> str:
+    return f"{kind}-{month}-{account_number}"
+
+
+def load_accounts(conn: sqlite3.Connection):
+    """Account numbers, tariff index and parsed APY (NaN when unreadable) of every client account"""
+    rows = conn.execute("""
+        SELECT c.account_number, c.tariff_type, c.interest_rate
+        FROM clients AS c
+        WHERE c.client_id = (SELECT MIN(client_id) FROM clients WHERE account_number = c.account_number)
+        ORDER BY c.account_number
+    """).fetchall()
+    accounts = [r[0] for r in rows]
+    tariffs = np.array([TARIFF_NAMES.index(r[1]) if r[1] in SCHEDULE else 0 for r in rows], dtype=np.int8)
+    rates = np.array([parse_rate(r[2]) for r in rows], dtype=float)
+    return accounts, tariffs, rates
+
+
+def average_daily_balances(conn: sqlite3.Connection, accounts: List[str], start: date, end: date) -> np.ndarray:
+    """Mean end-of-day balance over [start, end) for each account.
+
+    Days are transaction dates, as in account_stats and the archive. One query
+    for the balance carried into the month (from the ledger or, for archived
+    history, the balance checkpoint), one for the last completed balance of
+    each day in it, in ledger order; the days without activity are
+    forward-filled.
+    """
+    index = {account: i for i, account in enumerate(accounts)}
+    days = (end - start).days
+    # Column 0 holds the opening balance, columns 1..days the end-of-day balances
+    balances = np.full((len(accounts), days + 1), np.nan)
+    balances[:, 0] = 0.0
+    bounds = (start.isoformat(), end.isoformat())
+
+    for account_number, balance in conn.execute("""
+        SELECT a.account_number, COALESCE((
+            SELECT t.balance_after FROM transactions AS t
+            WHERE t.account_number = a.account_number AND t.status = 'COMPLETED'
+              AND t.transaction_date < ? AND t.balance_after IS NOT NULL
+            ORDER BY t.created_at DESC, t.transaction_id DESC
+            LIMIT 1
+        ), (
+            -- Only when every archived month precedes this one
+            SELECT c.balance FROM account_checkpoints AS c
+            WHERE c.account_number = a.account_number
+              AND NOT EXISTS (SELECT 1 FROM archived_months WHERE month >= ?)
+        ))
+        FROM account_balances AS a
+    """, (bounds[0], start.strftime("%Y-%m"))):
+        i = index.get(account_number)
+        if i is not None and balance is not None:
+            balances[i, 0] = balance
+
+    for account_number, day, balance in conn.execute("""
+        SELECT account_number, day, balance_after FROM (
+            SELECT t.account_number, t.transaction_date AS day, t.balance_after,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY t.account_number, t.transaction_date
+                       ORDER BY t.created_at DESC, t.transaction_id DESC
+                   ) AS rn
+            FROM account_balances AS a
+            JOIN transactions AS t ON t.account_number = a.account_number
+            WHERE t.status = 'COMPLETED' AND t.transaction_date >= ? AND t.transaction_date < ?
+              AND t.balance_after IS NOT NULL
+        )
+        WHERE rn = 1
+    """, bounds):
+        i = index.get(account_number)
+        if i is not None:
+            balances[i, (date.fromisoformat(day) - start).days + 1] = balance
+
+    # Forward fill along the days: each cell takes the last known column to its left
+    known = np.where(np.isnan(balances), 0, np.arange(days + 1))
+    np.maximum.accumulate(known, axis=1, out=known)
+    filled = balances[np.arange(len(accounts))[:, None], known]
+    return filled[:, 1:].mean(axis=1)
+
+
+def monthly_activity(conn: sqlite3.Connection, accounts: List[str], start: date, end: date):
+    """Completed customer transactions and direct deposits (AUTO credits) per account,
+    by transaction date"""
+    index = {account: i for i, account in enumerate(accounts)}
+    counts = np.zeros(len(accounts), dtype=np.int64)
+    deposits = np.zeros(len(accounts))
+    for account_number, count, direct in conn.execute(f"""
+        SELECT t.account_number,
+               SUM(t.transaction_type NOT IN {SYSTEM_TYPES}),
+               SUM(CASE WHEN t.channel = 'AUTO' AND t.transaction_type IN ('DEPOSIT', 'TRANSFER_IN')
+                        THEN abs(t.amount) ELSE 0 END)
+        FROM account_balances AS a
+        JOIN transactions AS t ON t.account_number = a.account_number
+        WHERE t.status = 'COMPLETED' AND t.transaction_date >= ? AND t.transaction_date < ?
+        GROUP BY t.account_number
+    """, (start.isoformat(), end.isoformat())):
+        i = index.get(account_number)
+        if i is not None:
+            counts[i] = count
+            deposits[i] = direct
+    return counts, deposits
+
+
+def _terms(tariffs: np.ndarray, key: str, missing: float) -> np.ndarray:
+    """Per-account value of a SCHEDULE term; ``missing`` where the tariff has none"""
+    table = np.array([missing if SCHEDULE[t][key] is None else SCHEDULE[t][key] for t in TARIFF_NAMES])
+    return table[tariffs]
+
+
+def _cents(values: np.ndarray) -> np.ndarray:
+    """Round half up to whole cents"""
+    return np.floor(values * 100 + 0.5) / 100
+
+
+def assess(tariffs: np.ndarray, rates: np.ndarray, balances: np.ndarray, counts: np.ndarray,
+           deposits: np.ndarray):
+    """Interest, maintenance fee and excessive-transaction fee per account, in dollars.
+
+    ``rates`` is the client's own APY (%), falling back to the tariff's where it
+    can't be read. With one account per client, the relationship balance used
+    for bonuses and waivers is the account's average daily balance.
+    """
+    bonus = np.zeros(len(tariffs))
+    for i, name in enumerate(TARIFF_NAMES):
+        # Tiers are in ascending order; the highest one reached applies
+        for threshold, tier_bonus in SCHEDULE[name]["bonus"]:
+            bonus = np.where((tariffs == i) & (balances > threshold), tier_bonus, bonus)
+    apy = np.where(np.isnan(rates), _terms(tariffs, "apy", 0.0), rates) + bonus
+    monthly_rate = (1 + apy / 100) ** (1 / 12) - 1
+    earns = (balances > 0) & (balances >= _terms(tariffs, "interest_minimum", 0.0))
+    interest = np.where(earns, _cents(balances * monthly_rate), 0.0)
+
+    waived = (
+        (balances >= _terms(tariffs, "balance_waiver", np.inf))
+        | (balances >= _terms(tariffs, "relationship_waiver", np.inf))
+        | (deposits >= _terms(tariffs, "direct_deposit_waiver", np.inf))
+    )
+    maintenance = np.where(waived, 0.0, _terms(tariffs, "monthly_fee", 0.0))
+    excess = np.maximum(counts - _terms(tariffs, "excess_after", np.inf), 0)
+    excess_fee = _cents(excess * _terms(tariffs, "excess_fee", 0.0))
+    return interest, maintenance, excess_fee, excess.astype(np.int64)
+
+
+def postings(month: str, accounts: List[str], interest, maintenance, excess_fee, excess) -> list:
+    """Ledger items in account order: the interest credit first, then the fees"""
+    items = []
+    for i in np.flatnonzero((interest > 0) | (maintenance > 0) | (excess_fee > 0)):
+        account_number = accounts[i]
+        if interest[i] > 0:
+            items.append({
+                "account_number": account_number, "transaction_type": "INTEREST",
+                "amount": f"{interest[i]:.2f}", "description": f"Monthly interest credit {month}",
+                "reference_number": reference("INT", month, account_number), "channel": "AUTO",
+            })
+        if maintenance[i] > 0:
+            items.append({
+                "account_number": account_number, "transaction_type": "FEE",
+                "amount": f"{-maintenance[i]:.2f}", "description": f"Monthly maintenance fee {month}",
+                "reference_number": reference("FEE-MNT", month, account_number), "channel": "AUTO",
+            })
+        if excess_fee[i] > 0:
+            items.append({
+                "account_number": account_number, "transaction_type": "FEE",
+                "amount": f"{-excess_fee[i]:.2f}",
+                "description": f"Excessive transaction fee {month} ({excess[i]} over the monthly allowance)",
+                "reference_number": reference("FEE-EXC", month, account_number), "channel": "AUTO",
+            })
+    return items
+
+
+def post_chunk(conn: sqlite3.Connection, items: List[dict], now: Optional[datetime] = None) -> dict:
+    """Post the items whose reference number isn't in the ledger yet.
+
+    Fees that would overdraw are recorded as FAILED (INSUFFICIENT_FUNDS) under
+    the same reference, so a rerun doesn't retry them. Needs the write lock:
+    run it inside BEGIN IMMEDIATE or as a LedgerWriter op.
+    """
+    now = now or datetime.now()
+    posted = {row[0] for row in conn.execute(
+        "SELECT reference_number FROM transactions WHERE reference_number IN (SELECT value FROM json_each(?))",
+        (json.dumps([item["reference_number"] for item in items]),),
+    )}
+    pending = [item for item in items if item["reference_number"] not in posted]
+    results = ledger.post_transactions(conn, pending, now=now)
+    rejected = [item for item, result in zip(pending, results) if not result["ok"]]
+    conn.executemany(_INSERT_FAILED, [(
+        item["account_number"], now.date().isoformat(), now.time().isoformat(), item["transaction_type"],
+        item["amount"], item["description"], item["reference_number"], now,
+    ) for item in rejected])
+    return {"posted": len(pending) - len(rejected), "rejected": len(rejected), "skipped": len(posted)}
+
+
+def run_month_end(conn: sqlite3.Connection, month: str, chunk_size: int = CHUNK_SIZE,
+                  dry_run: bool = False) -> dict:
+    """Accrue interest and assess fees for ``month`` (YYYY-MM) across all accounts"""
+    started = time.perf_counter()
+    start, end = month_bounds(month)
+    accounts, tariffs, rates = load_accounts(conn)
+    balances = average_daily_balances(conn, accounts, start, end)
+    counts, deposits = monthly_activity(conn, accounts, start, end)
+    interest, maintenance, excess_fee, excess = assess(tariffs, rates, balances, counts, deposits)
+    items = postings(month, accounts, interest, maintenance, excess_fee, excess)
+    computed = time.perf_counter() - started
+
+    totals = {"posted": 0, "rejected": 0, "skipped": 0}
+    if not dry_run:
+        for offset in range(0, len(items), chunk_size):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                outcome = post_chunk(conn, items[offset:offset + chunk_size])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            for key, value in outcome.items():
+                totals[key] += value
+    return {
+        "month": month,
+        "accounts": len(accounts),
+        "interest_postings": int(np.count_nonzero(interest)),
+        "interest_total": str(Decimal(f"{interest.sum():.2f}")),
+        "fee_postings": int(np.count_nonzero(maintenance) + np.count_nonzero(excess_fee)),
+        "fee_total": str(Decimal(f"{maintenance.sum() + excess_fee.sum():.2f}")),
+        **totals,
+        "compute_seconds": round(computed, 2),
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+if __name__ == "__main__":
+    last_month = (date.today().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+    parser = argparse.ArgumentParser(description="Post month-end interest and fees for every account")
+    parser.add_argument("--db", default="bank_transactions.db")
+    parser.add_argument("--month", default=last_month, help="YYYY-MM (default: last month)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="compute and report without posting")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    migrate(conn)
+    summary = run_month_end(conn, args.month, args.chunk_size, args.dry_run)
+    conn.close()
+    for key, value in summary.items():
+        print(f"{key:18s} {value}")
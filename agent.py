@@ -1,4 +1,162 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.tools import BaseTool
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+import metrics
+
+# Tool execution configuration
+AGENT_MAX_CONCURRENCY = int(os.environ.get("AGENT_MAX_CONCURRENCY", "8"))
+AGENT_TOOL_TIMEOUT = float(os.environ.get("AGENT_TOOL_TIMEOUT", "30"))
+# Threads for sync-only tools on the sync path; a timed-out call keeps its thread until it returns
+AGENT_TOOL_THREADS = int(os.environ.get("AGENT_TOOL_THREADS", "32"))
+
+# Event loop of the sync entry points, started on first use and never closed
+_tool_loop: Optional[asyncio.AbstractEventLoop] = None
+_tool_loop_lock = threading.Lock()
+
+
+def tool_loop() -> asyncio.AbstractEventLoop:
+    """Long-lived loop, on a daemon thread, that runs the tool steps of ``invoke``/``stream``.
+
+    ``asyncio.run`` joins its default executor on exit, so a turn would wait for
+    sync tools that had already timed out. This loop and its executor are never
+    shut down: an abandoned call finishes in the background.
+    """
+    global _tool_loop
+    with _tool_loop_lock:
+        if _tool_loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(AGENT_TOOL_THREADS, thread_name_prefix="agent-tool"))
+            threading.Thread(target=loop.run_forever, name="agent-tools", daemon=True).start()
+            _tool_loop = loop
+        return _tool_loop
+
+
 class Agent:
-    def __init__(self):
-        self.tools = []
-        
+    """Tool-calling agent whose tool calls within a turn run concurrently.
+
+    The graph is the usual ReAct loop (optional pre-model hook -> model -> tools
+    -> model ...), but when the model asks for several tools in one message they
+    are awaited together on asyncio, at most ``max_concurrency`` at a time, each
+    bounded by its own timeout (``tool_timeouts[name]`` or ``tool_timeout``). A
+    turn therefore takes as long as its slowest tool instead of the sum of all of
+    them. A tool that fails or times out is reported to the model as an error
+    ToolMessage; cancelling the turn cancels every tool still running.
+
+    ``invoke``/``stream`` are synchronous and run the tool steps on the shared
+    ``tool_loop``, so the agent works with sync checkpointers such as
+    SqliteSaver; ``ainvoke``/``astream`` run the same graph on the caller's
+    loop. Sync-only tools run in that loop's executor: a timeout ends the
+    turn's wait but cannot interrupt the call, which finishes in the background.
+    """
+
+    def __init__(self, model, tools: Optional[List[BaseTool]] = None, prompt: Optional[str] = None,
+                 checkpointer=None, pre_model_hook=None,
+                 max_concurrency: int = AGENT_MAX_CONCURRENCY,
+                 tool_timeout: float = AGENT_TOOL_TIMEOUT,
+                 tool_timeouts: Optional[Dict[str, float]] = None):
+        if isinstance(model, str):
+            from langchain.chat_models import init_chat_model
+            model = init_chat_model(model)
+        self.tools = list(tools or [])
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+        self.model = model.bind_tools(self.tools) if self.tools else model
+        self.prompt = prompt
+        self.max_concurrency = max_concurrency
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = dict(tool_timeouts or {})
+        self.graph = self._build(checkpointer, pre_model_hook)
+
+    # Graph
+
+    def _build(self, checkpointer, pre_model_hook):
+        builder = StateGraph(MessagesState)
+        builder.add_node("agent", RunnableLambda(self._call_model, afunc=self._acall_model))
+        builder.add_node("tools", RunnableLambda(self._run_tools_sync, afunc=self._run_tools))
+        entry = "agent"
+        if pre_model_hook is not None:
+            builder.add_node("pre_model_hook", pre_model_hook)
+            builder.add_edge("pre_model_hook", "agent")
+            entry = "pre_model_hook"
+        builder.add_edge(START, entry)
+        builder.add_conditional_edges("agent", self._route, ["tools", END])
+        builder.add_edge("tools", entry)
+        return builder.compile(checkpointer=checkpointer)
+
+    @staticmethod
+    def _route(state: MessagesState) -> str:
+        last = state["messages"][-1]
+        return "tools" if isinstance(last, AIMessage) and last.tool_calls else END
+
+    def _model_input(self, state: MessagesState) -> list:
+        messages = state["messages"]
+        return [SystemMessage(self.prompt), *messages] if self.prompt else messages
+
+    def _call_model(self, state: MessagesState, config: RunnableConfig) -> dict:
+        return {"messages": [self.model.invoke(self._model_input(state), config)]}
+
+    async def _acall_model(self, state: MessagesState, config: RunnableConfig) -> dict:
+        return {"messages": [await self.model.ainvoke(self._model_input(state), config)]}
+
+    # Tool execution
+
+    def _run_tools_sync(self, state: MessagesState, config: RunnableConfig) -> dict:
+        # Also safe from a thread that already runs a loop (e.g. Jupyter)
+        return asyncio.run_coroutine_threadsafe(self._run_tools(state, config), tool_loop()).result()
+
+    async def _run_tools(self, state: MessagesState, config: RunnableConfig) -> dict:
+        calls = state["messages"][-1].tool_calls
+        # Created per turn: a semaphore is bound to the loop that first waits on it
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(self._run_tool(call, semaphore, config) for call in calls))
+        return {"messages": list(results)}
+
+    async def _run_tool(self, call: dict, semaphore: asyncio.Semaphore,
+                        config: RunnableConfig) -> ToolMessage:
+        name = call["name"]
+        tool = self.tools_by_name.get(name)
+        if tool is None:
+            return self._error(call, f"unknown tool {name!r}; available: {', '.join(self.tools_by_name)}")
+        timeout = self.tool_timeouts.get(name, self.tool_timeout)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                output = await asyncio.wait_for(tool.ainvoke(call["args"], config), timeout)
+            except asyncio.TimeoutError:
+                metrics.tool_seconds.observe(time.perf_counter() - started, name, "timeout")
+                return self._error(call, f"{name} timed out after {timeout:g}s")
+            except Exception as exc:
+                metrics.tool_seconds.observe(time.perf_counter() - started, name, "error")
+                return self._error(call, f"{name} failed: {exc!r}")
+            metrics.tool_seconds.observe(time.perf_counter() - started, name, "ok")
+        if isinstance(output, ToolMessage):
+            return output
+        content = output if isinstance(output, (str, list)) else str(output)
+        return ToolMessage(content=content, name=name, tool_call_id=call["id"])
+
+    @staticmethod
+    def _error(call: dict, text: str) -> ToolMessage:
+        return ToolMessage(content=f"Error: {text}. Please fix your request and try again.",
+                           name=call["name"], tool_call_id=call["id"], status="error")
+
+    # Entry points
+
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return self.graph.invoke(input, config, **kwargs)
+
+    def stream(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return self.graph.stream(input, config, **kwargs)
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return await self.graph.ainvoke(input, config, **kwargs)
+
+    def astream(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        return self.graph.astream(input, config, **kwargs)
@@ -0,0 +1,446 @@
+import argparse
+import bisect
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from accrual import month_bounds
+from migrations import migrate
+
+# Archive configuration: whole months older than the horizon (by transaction
+# date) move out of the transactions table into ARCHIVE_DIR/YYYY-MM.<version>/
+ARCHIVE_DIR = os.environ.get("BANK_ARCHIVE_DIR", "ledger_archive")
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("BANK_ARCHIVE_HORIZON_DAYS", "365"))
+
+# Column order of the transactions table; archived rows come back in this shape
+COLUMNS = (
+    "transaction_id", "account_number", "transaction_date", "transaction_time", "transaction_type",
+    "amount", "balance_after", "description", "reference_number", "counterparty_account",
+    "counterparty_name", "channel", "location", "status", "failure_reason", "created_at",
+)
+_POSITION = {name: i for i, name in enumerate(COLUMNS)}
+# Dictionary-encoded columns: int16 codes into the manifest's value list, -1 for NULL
+CODED = ("transaction_type", "channel", "status", "failure_reason")
+# Variable-length columns: int64 offsets into a UTF-8 heap plus a NULL mask
+TEXT = (
+    "transaction_time", "description", "reference_number", "counterparty_account",
+    "counterparty_name", "location", "created_at",
+)
+# Amounts are stored in cents; this marks a NULL balance_after
+NULL_CENTS = np.iinfo(np.int64).min
+FORMAT_VERSION = 1
+
+
+class ArchivedRow(tuple):
+    """An archived transaction, indexable like sqlite3.Row: by position or column name"""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = _POSITION[key]
+        return tuple.__getitem__(self, key)
+
+    def keys(self) -> List[str]:
+        return list(COLUMNS)
+
+
+def _order_key(row) -> tuple:
+    # Listing order of the API and the pagination cursor
+    return row["created_at"], row["transaction_id"]
+
+
+def _date_key(row) -> tuple:
+    # Order of search-by-date-range
+    return row["transaction_date"], row["transaction_time"], row["transaction_id"]
+
+
+def _amount(cents: int):
+    # DECIMAL columns have NUMERIC affinity: SQLite keeps whole amounts as integers
+    return cents // 100 if cents % 100 == 0 else cents / 100
+
+
+def _cents(values) -> np.ndarray:
+    amounts = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    cents = np.full(len(amounts), NULL_CENTS, dtype=np.int64)
+    known = ~np.isnan(amounts)
+    cents[known] = np.rint(amounts[known] * 100).astype(np.int64)
+    return cents
+
+
+class _Text:
+    """Memory-mapped text column"""
+
+    def __init__(self, path: str, name: str):
+        self.offsets = np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+        self.nulls = np.load(os.path.join(path, f"{name}.nulls.npy"), mmap_mode="r")
+        heap = os.path.join(path, f"{name}.bin")
+        # np.memmap refuses empty files
+        self.heap = np.memmap(heap, dtype=np.uint8, mode="r") if os.path.getsize(heap) else b""
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self.nulls[i]:
+            return None
+        return bytes(self.heap[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+
+def _write_text(path: str, name: str, values: Sequence):
+    encoded = [b"" if v is None else str(v).encode() for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    np.save(os.path.join(path, f"{name}.offsets.npy"), offsets)
+    np.save(os.path.join(path, f"{name}.nulls.npy"), np.array([v is None for v in values], dtype=bool))
+    with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+
+
+def write_month(path: str, month: str, rows: Sequence) -> dict:
+    """Write ``rows`` as column files under ``path``; returns the manifest.
+
+    Rows must be sorted by account_number, created_at and transaction_id, so
+    each account's rows are one contiguous range, listed in the manifest.
+    """
+    os.makedirs(path)
+    accounts = {}
+    for i, row in enumerate(rows):
+        account_range = accounts.setdefault(row["account_number"], [i, i])
+        account_range[1] = i + 1
+    codes = {}
+    for name in CODED:
+        values = [row[name] for row in rows]
+        codes[name] = sorted({v for v in values if v is not None})
+        index = {v: i for i, v in enumerate(codes[name])}
+        np.save(os.path.join(path, f"{name}.npy"),
+                np.array([-1 if v is None else index[v] for v in values], dtype=np.int16))
+    np.save(os.path.join(path, "transaction_id.npy"),
+            np.array([row["transaction_id"] for row in rows], dtype=np.int64))
+    np.save(os.path.join(path, "transaction_date.npy"),
+            np.array([date.fromisoformat(row["transaction_date"]).toordinal() for row in rows], dtype=np.int32))
+    np.save(os.path.join(path, "amount.npy"), _cents(row["amount"] for row in rows))
+    np.save(os.path.join(path, "balance_after.npy"), _cents(row["balance_after"] for row in rows))
+    for name in TEXT:
+        _write_text(path, name, [row[name] for row in rows])
+    manifest = {"format": FORMAT_VERSION, "month": month, "rows": len(rows), "accounts": accounts, "codes": codes}
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+class MonthArchive:
+    """Read side of one archived month; every column is memory-mapped"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.month = manifest["month"]
+        self.rows = manifest["rows"]
+        self.accounts: Dict[str, Tuple[int, int]] = {a: tuple(r) for a, r in manifest["accounts"].items()}
+        self.codes: Dict[str, List[str]] = manifest["codes"]
+        self._columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ("transaction_id", "transaction_date", "amount", "balance_after", *CODED)
+        }
+        self._text = {name: _Text(path, name) for name in TEXT}
+
+    def _code(self, name: str, i: int) -> Optional[str]:
+        code = int(self._columns[name][i])
+        return None if code < 0 else self.codes[name][code]
+
+    def row(self, i: int, account_number: str) -> ArchivedRow:
+        text = self._text
+        balance = int(self._columns["balance_after"][i])
+        return ArchivedRow((
+            int(self._columns["transaction_id"][i]),
+            account_number,
+            date.fromordinal(int(self._columns["transaction_date"][i])).isoformat(),
+            text["transaction_time"][i],
+            self._code("transaction_type", i),
+            _amount(int(self._columns["amount"][i])),
+            None if balance == NULL_CENTS else _amount(balance),
+            text["description"][i],
+            text["reference_number"][i],
+            text["counterparty_account"][i],
+            text["counterparty_name"][i],
+            self._code("channel", i),
+            text["location"][i],
+            self._code("status", i),
+            self._code("failure_reason", i),
+            text["created_at"][i],
+        ))
+
+    def _key(self, i: int) -> tuple:
+        return self._text["created_at"][i], int(self._columns["transaction_id"][i])
+
+    def all_rows(self) -> Iterator[ArchivedRow]:
+        for account_number, (start, end) in self.accounts.items():
+            for i in range(start, end):
+                yield self.row(i, account_number)
+
+    def account_rows(self, account_number: str, before: Optional[tuple] = None,
+                     status: Optional[str] = None) -> Iterator[ArchivedRow]:
+        """An account's rows newest first, optionally only those before the key
+        ``(created_at, transaction_id)`` and with ``status``"""
+        start, end = self.accounts.get(account_number, (0, 0))
+        if before is not None:
+            end = start + bisect.bisect_left(range(start, end), tuple(before), key=self._key)
+        code = None
+        if status is not None:
+            if status not in self.codes["status"]:
+                return
+            code = self.codes["status"].index(status)
+        statuses = self._columns["status"]
+        for i in range(end - 1, start - 1, -1):
+            if code is None or statuses[i] == code:
+                yield self.row(i, account_number)
+
+    def date_range_rows(self, account_number: str, begin: str, end: str) -> List[ArchivedRow]:
+        start, stop = self.accounts.get(account_number, (0, 0))
+        dates = self._columns["transaction_date"]
+        return [
+            self.row(i, account_number) for i in range(start, stop)
+            if begin <= date.fromordinal(int(dates[i])).isoformat() <= end
+        ]
+
+
+# Opened months, reused until the month is archived again
+_open_months: Dict[tuple, Tuple[str, MonthArchive]] = {}
+_open_lock = threading.Lock()
+
+
+def open_month(month: str, version: str, directory: str = ARCHIVE_DIR) -> MonthArchive:
+    key = (os.path.abspath(directory), month)
+    with _open_lock:
+        cached = _open_months.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    archive = MonthArchive(os.path.join(directory, version))
+    with _open_lock:
+        _open_months[key] = (version, archive)
+    return archive
+
+
+def registered_months(conn: sqlite3.Connection) -> Dict[str, tuple]:
+    """``{month: (version, last_created_at)}`` of the archived months; the
+    version is the month's directory under the archive directory"""
+    try:
+        rows = conn.execute("SELECT month, directory, last_created_at FROM archived_months").fetchall()
+    except sqlite3.OperationalError:
+        # Database not migrated to the archive schema: nothing is archived
+        return {}
+    return {month: (version or month, last_created_at) for month, version, last_created_at in rows}
+
+
+def account_transactions(conn: sqlite3.Connection, account_number: str, status: Optional[str] = None,
+                         before: Optional[tuple] = None, directory: str = ARCHIVE_DIR) -> Iterator:
+    """Archived transactions of an account, newest first, after the cursor key ``before``"""
+    months = sorted(registered_months(conn).items(), reverse=True)
+    return heapq.merge(*(
+        open_month(month, version, directory).account_rows(account_number, before, status)
+        for month, (version, _) in months
+    ), key=_order_key, reverse=True)
+
+
+def with_archived(conn: sqlite3.Connection, hot: Iterable, account_number: str,
+                  status: Optional[str] = None, before: Optional[tuple] = None,
+                  limit: Optional[int] = None, directory: str = ARCHIVE_DIR) -> Iterator:
+    """Merge hot rows (newest first) of an account with its archived ones.
+
+    When ``limit`` hot rows are all newer than anything archived, the archive is
+    not opened.
+    """
+    months = registered_months(conn)
+    if not months:
+        return iter(hot)
+    if limit is not None:
+        hot = list(hot)
+        newest = max((last for _, last in months.values() if last is not None), default=None)
+        if len(hot) >= limit and (newest is None or _order_key(hot[limit - 1])[0] > newest):
+            return iter(hot[:limit])
+    rows = heapq.merge(hot, account_transactions(conn, account_number, status, before, directory),
+                       key=_order_key, reverse=True)
+    return rows if limit is None else islice(rows, limit)
+
+
+def with_date_range(conn: sqlite3.Connection, rows: List, account_number: str, begin_date: str,
+                    end_date: str, limit: int = 100, directory: str = ARCHIVE_DIR) -> List:
+    """Add archived rows to the hot result of search-by-date-range, keeping its order and limit"""
+    archived = []
+    for month, (version, _) in registered_months(conn).items():
+        if f"{month}-01" <= end_date and f"{month}-31" >= begin_date:
+            archived.extend(open_month(month, version, directory).date_range_rows(
+                account_number, begin_date, end_date))
+    if not archived:
+        return rows
+    return sorted([*rows, *archived], key=_date_key, reverse=True)[:limit]
+
+
+# Write side
+
+def _archivable_months(conn: sqlite3.Connection, horizon_days: int, today: date) -> List[str]:
+    # Never the current or the previous month: month-end accrual still reads them
+    cutoff = min((today - timedelta(days=horizon_days)).replace(day=1),
+                 (today.replace(day=1) - timedelta(days=1)).replace(day=1))
+    return [row[0] for row in conn.execute(
+        "SELECT DISTINCT month FROM account_stats WHERE month < ? ORDER BY month",
+        (cutoff.strftime("%Y-%m"),),
+    )]
+
+
+def _checkpoints(rows: Sequence) -> List[tuple]:
+    latest = {}
+    for row in rows:
+        if row["status"] == "COMPLETED" and row["balance_after"] is not None:
+            current = latest.get(row["account_number"])
+            if current is None or _order_key(row) > _order_key(current):
+                latest[row["account_number"]] = row
+    return [
+        (account_number, row["balance_after"], row["transaction_id"], row["created_at"])
+        for account_number, row in latest.items()
+    ]
+
+
+def _hot_rows(conn: sqlite3.Connection, month: str, columns: str) -> sqlite3.Cursor:
+    # account_stats lists the accounts active in the month, so each one is a
+    # range scan of idx_transactions_account_date instead of a full table scan
+    start, end = month_bounds(month)
+    return conn.execute(f"""
+        SELECT {columns} FROM account_stats AS s
+        JOIN transactions AS t
+          ON t.account_number = s.account_number AND t.transaction_date >= ? AND t.transaction_date < ?
+        WHERE s.month = ?
+    """, (start.isoformat(), end.isoformat(), month))
+
+
+_UPSERT_CHECKPOINT = """
+    INSERT INTO account_checkpoints (account_number, balance, last_transaction_id, as_of)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (account_number) DO UPDATE SET
+        balance = excluded.balance,
+        last_transaction_id = excluded.last_transaction_id,
+        as_of = excluded.as_of
+    WHERE (excluded.as_of, excluded.last_transaction_id)
+          >= (account_checkpoints.as_of, account_checkpoints.last_transaction_id)
+"""
+
+
+def archive_month(conn: sqlite3.Connection, month: str, directory: str = ARCHIVE_DIR,
+                  now: Optional[datetime] = None) -> int:
+    """Move every transaction of ``month`` (YYYY-MM, by transaction_date) to the archive.
+
+    Needs the write lock (run it inside BEGIN IMMEDIATE); returns the rows moved.
+    Every run writes a new version directory, YYYY-MM.<archived_at>, and
+    registers it in archived_months in the caller's transaction. Readers only
+    open the registered version, so until the commit they keep reading the
+    previous one, and after a rollback the new files are never read. A month
+    archived before is rewritten with its new rows merged in; the versions it
+    replaces are left for ``remove_old_versions`` once the caller committed.
+    Balance checkpoints take over from the moved rows, and the month's
+    account_stats, which the delete triggers would zero, are restored.
+    """
+    hot = _hot_rows(conn, month, "t.*").fetchall()
+    if not hot:
+        return 0
+    registered = registered_months(conn)
+    rows = list(hot)
+    if month in registered:
+        rows.extend(open_month(month, registered[month][0], directory).all_rows())
+    rows.sort(key=lambda row: (row["account_number"], *_order_key(row)))
+
+    archived_at = now or datetime.now()
+    version = f"{month}.{archived_at.strftime('%Y%m%dT%H%M%S%f')}"
+    os.makedirs(directory, exist_ok=True)
+    write_month(os.path.join(directory, version), month, rows)
+
+    stats = conn.execute("SELECT * FROM account_stats WHERE month = ?", (month,)).fetchall()
+    failures = conn.execute("SELECT * FROM account_failure_stats WHERE month = ?", (month,)).fetchall()
+    conn.execute("DELETE FROM transactions WHERE transaction_id IN (SELECT value FROM json_each(?))",
+                 (json.dumps([row["transaction_id"] for row in hot]),))
+    conn.executemany(f"INSERT OR REPLACE INTO account_stats VALUES ({', '.join('?' * 9)})",
+                     [tuple(row) for row in stats])
+    conn.executemany("INSERT OR REPLACE INTO account_failure_stats VALUES (?, ?, ?, ?)",
+                     [tuple(row) for row in failures])
+    conn.executemany(_UPSERT_CHECKPOINT, _checkpoints(hot))
+    created = [row["created_at"] for row in rows]
+    conn.execute("""
+        INSERT OR REPLACE INTO archived_months
+            (month, rows, first_created_at, last_created_at, archived_at, directory)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (month, len(rows), min(created), max(created), archived_at.isoformat(), version))
+    return len(hot)
+
+
+def remove_old_versions(conn: sqlite3.Connection, month: str, directory: str = ARCHIVE_DIR) -> int:
+    """Delete the directories of ``month`` other than its registered version.
+
+    Run it after the archiving transaction ended: it removes the versions a
+    rerun replaced and the files of runs that rolled back. It holds the write
+    lock meanwhile, so a run in progress elsewhere keeps its new files.
+    Returns the directories removed.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = registered_months(conn).get(month, (None,))[0]
+        removed = 0
+        for name in os.listdir(directory):
+            if (name == month or name.startswith(f"{month}.")) and name != current:
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+                removed += 1
+    finally:
+        conn.rollback()
+    return removed
+
+
+def run_archive(conn: sqlite3.Connection, horizon_days: int = ARCHIVE_HORIZON_DAYS,
+                directory: str = ARCHIVE_DIR, dry_run: bool = False,
+                today: Optional[date] = None) -> List[dict]:
+    """Archive every month older than ``horizon_days``, one write transaction per month"""
+    results = []
+    for month in _archivable_months(conn, horizon_days, today or date.today()):
+        started = time.perf_counter()
+        if dry_run:
+            count = _hot_rows(conn, month, "COUNT(*)").fetchone()[0]
+        else:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                count = archive_month(conn, month, directory)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                remove_old_versions(conn, month, directory)
+                raise
+            remove_old_versions(conn, month, directory)
+        if count:
+            results.append({"month": month, "rows": count, "seconds": round(time.perf_counter() - started, 2)})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old months of the ledger into the columnar archive")
+    parser.add_argument("--db", default="bank_transactions.db")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--horizon-days", type=int, default=ARCHIVE_HORIZON_DAYS,
+                        help="archive months that ended at least this many days ago")
+    parser.add_argument("--dry-run", action="store_true", help="list the months and row counts only")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout=5000")
+    migrate(conn)
+    results = run_archive(conn, args.horizon_days, args.archive_dir, args.dry_run)
+    conn.close()
+    for result in results:
+        print(f"{result['month']}  {result['rows']:>8} row(s)  {result['seconds']}s")
+    print(f"{sum(r['rows'] for r in results)} row(s) in {len(results)} month(s)"
+          + (" would be archived" if args.dry_run else " archived"))
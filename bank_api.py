@@ -1,18 +1,44 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from datetime import datetime, date, time
 from decimal import Decimal
 import sqlite3
 import os
+import base64
+import json
+import re
 from contextlib import contextmanager
+from itertools import islice
+
+import archive
+from db import ChangeFeed, ConnectionPool
+from serialization import RowEncoder
+import ledger
+import metrics
+from migrations import migrate
+from monitor import TransactionMonitor
 
 app = FastAPI(title="Mock Bank API", version="1.0.0")
+app.add_middleware(metrics.RequestMetrics)
 security = HTTPBearer()
 
 # Database configuration
-DATABASE_PATH = "bank_transactions.db"
+DATABASE_PATH = os.environ.get("BANK_DATABASE_PATH", "bank_transactions.db")
+DB_POOL_SIZE = int(os.environ.get("BANK_DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("BANK_DB_POOL_TIMEOUT", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("BANK_DB_STATEMENT_CACHE_SIZE", "256"))
+LEDGER_MAX_BATCH = int(os.environ.get("BANK_LEDGER_MAX_BATCH", "256"))
+BATCH_CHUNK_SIZE = int(os.environ.get("BANK_BATCH_CHUNK_SIZE", "1000"))
+BATCH_MAX_ITEMS = int(os.environ.get("BANK_BATCH_MAX_ITEMS", "100000"))
+# How often, at most, the monitor looks for client limits changed by other processes
+MONITOR_CLIENT_POLL_SECONDS = float(os.environ.get("BANK_MONITOR_CLIENT_POLL_SECONDS", "1"))
+# Time every SQL statement on pooled and writer connections (see metrics.py)
+SQL_METRICS = os.environ.get("BANK_SQL_METRICS", "1") == "1"
+MAX_PAGE_SIZE = 1000
+STREAM_FETCH_SIZE = 500
 
 # Pydantic models
 class TransactionResponse(BaseModel):
@@ -43,27 +69,108 @@ class TransactionCreate(BaseModel):
     channel: str = Field(..., pattern="^(ATM|ONLINE|MOBILE|BRANCH|CARD|AUTO)$")
     location: Optional[str] = None
 
+# Hot read endpoints encode rows straight to JSON with the TransactionResponse schema
+transaction_encoder = RowEncoder(TransactionResponse)
+
 class BalanceResponse(BaseModel):
     account_number: str
     current_balance: Decimal
     available_balance: Decimal
     last_updated: datetime
 
+class AccountSummaryResponse(BaseModel):
+    account_number: str
+    month: Optional[str]
+    total_transactions: int
+    completed_transactions: int
+    failed_transactions: int
+    cancelled_transactions: int
+    pending_transactions: int
+    total_credits: Decimal
+    total_debits: Decimal
+    current_balance: Optional[Decimal]
+    failure_reasons: dict
+
 class RetryResponse(BaseModel):
     transaction_id: int
     old_status: str
     new_status: str
     message: str
 
+class BatchItemResult(BaseModel):
+    index: int
+    success: bool
+    transaction_id: Optional[int] = None
+    balance_after: Optional[Decimal] = None
+    error: Optional[str] = None
+    failure_reason: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    received: int
+    succeeded: int
+    failed: int
+    results: List[BatchItemResult]
+
+def _connection_factory():
+    return metrics.InstrumentedConnection if SQL_METRICS else sqlite3.Connection
+
+# Connection pool, created lazily so DATABASE_PATH can be overridden before first use
+_pool: Optional[ConnectionPool] = None
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            DATABASE_PATH,
+            size=DB_POOL_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            factory=_connection_factory(),
+        )
+    return _pool
+
 # Database context manager
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
+    with get_pool().connection() as conn:
         yield conn
-    finally:
-        conn.close()
+
+# Single writer for ledger mutations; batches concurrent writes into one commit
+_writer: Optional[ledger.LedgerWriter] = None
+
+def get_writer() -> ledger.LedgerWriter:
+    global _writer
+    if _writer is None:
+        _writer = ledger.LedgerWriter(DATABASE_PATH, max_batch=LEDGER_MAX_BATCH,
+                                      factory=_connection_factory())
+    return _writer
+
+# Limit and fraud checks, fed by every ledger write through the writer's listeners
+_monitor: Optional[TransactionMonitor] = None
+
+def get_monitor() -> TransactionMonitor:
+    global _monitor
+    if _monitor is None:
+        _monitor = TransactionMonitor()
+    return _monitor
+
+# Tariff and daily_limit changes written outside this process (e.g. by the agent's tools)
+_client_changes: Optional[ChangeFeed] = None
+
+def refresh_client_limits(conn: sqlite3.Connection):
+    """Re-read the monitor's limits for clients changed since the last poll"""
+    if _client_changes is not None:
+        accounts = [account for _, account in _client_changes.poll()]
+        if accounts:
+            get_monitor().reload_clients(conn, accounts)
+
+monitor_rejections = metrics.REGISTRY.counter(
+    "bank_monitor_rejections_total", "Transactions refused by the limit and fraud monitor", ("reason",)
+)
+
+async def run_db(fn, *args):
+    """Run a blocking database function off the event loop"""
+    return await get_pool().run(fn, *args)
 
 # Authentication (simple token validation for demo)
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -78,27 +185,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
 # Initialize database
 def init_db():
     with get_db() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_number TEXT NOT NULL,
-                transaction_date DATE NOT NULL,
-                transaction_time TIME NOT NULL,
-                transaction_type TEXT NOT NULL CHECK (transaction_type IN ('DEPOSIT', 'WITHDRAWAL', 'TRANSFER_IN', 'TRANSFER_OUT', 'FEE', 'INTEREST', 'CARD')),
-                amount DECIMAL(10, 2) NOT NULL,
-                balance_after DECIMAL(10, 2),
-                description TEXT,
-                reference_number TEXT UNIQUE,
-                counterparty_account TEXT,
-                counterparty_name TEXT,
-                channel TEXT CHECK (channel IN ('ATM', 'ONLINE', 'MOBILE', 'BRANCH', 'CARD', 'AUTO')),
-                location TEXT,
-                status TEXT NOT NULL DEFAULT 'COMPLETED' CHECK (status IN ('COMPLETED', 'FAILED', 'PENDING', 'CANCELLED')),
-                failure_reason TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
+        migrate(conn)
 
 # API Endpoints
 
@@ -107,77 +194,240 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.now()}
 
+@app.get("/db/metrics")
+async def database_metrics(token: str = Depends(verify_token)):
+    """Connection pool size, wait time and queue depth"""
+    stats = get_pool().metrics()
+    stats["writer"] = get_writer().metrics()
+    return stats
+
+def _collect_database_metrics():
+    pool = get_pool().metrics()
+    writer = get_writer().metrics()
+    return [
+        ("bank_db_pool_size", "gauge", "Maximum pooled connections", {(): pool["pool_size"]}),
+        ("bank_db_pool_connections", "gauge", "Pooled connections by state", {
+            (("state", "in_use"),): pool["connections_in_use"],
+            (("state", "idle"),): pool["connections_idle"],
+        }),
+        ("bank_db_pool_waiting", "gauge", "Threads waiting for a connection", {(): pool["waiting_for_connection"]}),
+        ("bank_db_pool_queue_depth", "gauge", "Calls queued for the pool executor", {(): pool["queue_depth"]}),
+        ("bank_db_pool_acquired_total", "counter", "Connections handed out", {(): pool["acquired_total"]}),
+        ("bank_db_pool_timeouts_total", "counter", "Acquisitions that timed out", {(): pool["timeouts_total"]}),
+        ("bank_db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection",
+         {(): pool["wait_seconds_total"]}),
+        ("bank_ledger_writer_queue_depth", "gauge", "Ledger ops waiting for the writer", {(): writer["queue_depth"]}),
+        ("bank_ledger_writer_batches_total", "counter", "Committed writer batches", {(): writer["batches_total"]}),
+        ("bank_ledger_writer_ops_total", "counter", "Ledger ops run by the writer", {(): writer["ops_total"]}),
+        ("bank_ledger_writer_ops_failed_total", "counter", "Ledger ops rolled back",
+         {(): writer["ops_failed_total"]}),
+    ]
+
+metrics.REGISTRY.register_collector("database", _collect_database_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(token: str = Depends(verify_token)):
+    """Request, SQL, pool and writer metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/account/{account_number}/balance", response_model=BalanceResponse)
 async def get_account_balance(account_number: str, token: str = Depends(verify_token)):
     """Get current account balance"""
+    def query(conn):
+        return ledger.current_balance(conn, account_number)
+
+    result = await run_db(query)
+    if not result:
+        raise HTTPException(status_code=404, detail="Account not found or no completed transactions")
+
+    # For simplicity, available balance equals current balance (no holds/pending)
+    balance = Decimal(str(result['balance']))
+
+    return BalanceResponse(
+        account_number=account_number,
+        current_balance=balance,
+        available_balance=balance,
+        last_updated=datetime.fromisoformat(result['updated_at'])
+    )
+
+@app.get("/account/{account_number}/summary", response_model=AccountSummaryResponse)
+async def get_account_summary(
+    account_number: str,
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$", description="YYYY-MM; all months when omitted"),
+    token: str = Depends(verify_token),
+):
+    """Transaction counts by status, credit and debit totals and failure reasons.
+
+    Read from the trigger-maintained account_stats tables, so the cost does not
+    grow with the number of transactions.
+    """
+    summary = await run_db(ledger.account_summary, account_number, month)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No transactions for this account and month")
+    return AccountSummaryResponse(**summary)
+
+# Keyset pagination over (created_at, transaction_id), newest first. The cursor
+# is the key of the last row on the previous page, returned in X-Next-Cursor.
+def encode_cursor(row) -> str:
+    key = json.dumps([row['created_at'], row['transaction_id']])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), int(transaction_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _page_query(where: str, params: list, cursor: Optional[str], limit: Optional[int]):
+    query = f"SELECT * FROM transactions WHERE {where}"
+    params = list(params)
+    if cursor:
+        query += " AND (created_at, transaction_id) < (?, ?)"
+        params.extend(decode_cursor(cursor))
+    query += " ORDER BY created_at DESC, transaction_id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+def _cursor_rows(cursor):
+    while True:
+        rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+def _stream_transactions(query: str, params: list, archived: Optional[dict] = None):
+    """Yield NDJSON lines straight from the database cursor.
+
+    With ``archived`` (archive.with_archived arguments) the account's archived
+    rows are merged in, in the same order.
+    """
     with get_db() as conn:
-        # Get the most recent transaction to determine current balance
-        cursor = conn.execute("""
-            SELECT balance_after, created_at 
-            FROM transactions 
-            WHERE account_number = ? AND status = 'COMPLETED' AND balance_after IS NOT NULL
-            ORDER BY created_at DESC, transaction_id DESC
-            LIMIT 1
-        """, (account_number,))
-        
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="Account not found or no completed transactions")
-        
-        # For simplicity, available balance equals current balance (no holds/pending)
-        current_balance = Decimal(str(result['balance_after']))
-        
-        return BalanceResponse(
-            account_number=account_number,
-            current_balance=current_balance,
-            available_balance=current_balance,
-            last_updated=datetime.fromisoformat(result['created_at'])
-        )
+        cursor = conn.execute(query, params)
+        if archived is None:
+            fetch = cursor.fetchmany
+        else:
+            merged = archive.with_archived(conn, _cursor_rows(cursor), **archived)
+            fetch = lambda size: list(islice(merged, size))
+        while True:
+            rows = fetch(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            yield transaction_encoder.encode_ndjson(rows)
+
+async def _transactions_page(where: str, params: list, cursor: Optional[str], limit: int,
+                             stream: bool, archived: Optional[dict] = None):
+    if archived is not None and cursor:
+        archived = {**archived, "before": decode_cursor(cursor)}
+    if stream:
+        query, params = _page_query(where, params, cursor, None)
+        return StreamingResponse(_stream_transactions(query, params, archived),
+                                 media_type="application/x-ndjson")
+
+    query, params = _page_query(where, params, cursor, limit)
+
+    def fetch(conn):
+        rows = conn.execute(query, params).fetchall()
+        if archived is not None:
+            rows = list(archive.with_archived(conn, rows, limit=limit, **archived))
+        return rows
+
+    transactions = await run_db(fetch)
+    response = Response(content=transaction_encoder.encode_rows(transactions), media_type="application/json")
+    if len(transactions) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(transactions[-1])
+    return response
 
 @app.get("/account/{account_number}/transactions", response_model=List[TransactionResponse])
 async def get_transactions(
     account_number: str,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
     status_filter: Optional[str] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False,
     token: str = Depends(verify_token)
 ):
-    """Get account transactions with optional filtering"""
-    with get_db() as conn:
-        query = "SELECT * FROM transactions WHERE account_number = ?"
-        params = [account_number]
-        
-        if status_filter:
-            query += " AND status = ?"
-            params.append(status_filter)
-        
-        query += " ORDER BY created_at DESC, transaction_id DESC LIMIT ?"
-        params.append(limit)
-        
-        cursor = conn.execute(query, params)
-        transactions = cursor.fetchall()
-        
-        if not transactions:
-            return []
-        
-        return [TransactionResponse(**dict(t)) for t in transactions]
+    """Get account transactions with optional filtering.
+
+    Pages are keyset-paginated: pass the X-Next-Cursor header of one page as
+    ``cursor`` to get the next. With ``stream=true`` every remaining row is
+    streamed as NDJSON instead. Months moved to the archive (archive.py) are
+    read from there, so listings continue past the hot table.
+    """
+    where = "account_number = ?"
+    params = [account_number]
+    if status_filter:
+        where += " AND status = ?"
+        params.append(status_filter)
+    archived = {"account_number": account_number, "status": status_filter or None}
+    return await _transactions_page(where, params, cursor, limit, stream, archived)
 
 @app.get("/transactions/failed", response_model=List[TransactionResponse])
-async def get_failed_transactions(token: str = Depends(verify_token)):
-    """Get all failed transactions that can be retried"""
-    with get_db() as conn:
-        cursor = conn.execute("""
-            SELECT * FROM transactions 
-            WHERE status = 'FAILED'
-            ORDER BY created_at DESC
-        """)
-        transactions = cursor.fetchall()
-        
-        return [TransactionResponse(**dict(t)) for t in transactions]
+async def get_failed_transactions(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    token: str = Depends(verify_token)
+):
+    """Get failed transactions that can be retried, paginated like account transactions"""
+    return await _transactions_page("status = 'FAILED'", [], cursor, limit, stream)
+
+_SEARCH_TOKEN = re.compile(r"\w+")
+
+def fts_query(text: str) -> Optional[str]:
+    """FTS5 MATCH expression for free text: any word may match, the last as a prefix.
+
+    BM25 ranks rows matching more (and rarer) words first, so filler words such as
+    "to" in "payment to ABC" don't exclude results. Words are quoted, so operators
+    and punctuation in user input are never parsed as FTS5 syntax.
+    """
+    words = _SEARCH_TOKEN.findall(text)
+    if not words:
+        return None
+    return " OR ".join(f'"{w}"' for w in words) + "*"
+
+@app.get("/transactions/search", response_model=List[TransactionResponse])
+async def search_transactions(
+    q: str = Query(..., min_length=1, max_length=200),
+    account_number: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    token: str = Depends(verify_token)
+):
+    """Full-text search over description, counterparty name and location.
+
+    Results are ranked by BM25 (counterparty matches weigh most), optionally
+    restricted to one account, and paginated with ``limit``/``offset``.
+    """
+    match = fts_query(q)
+    if match is None:
+        raise HTTPException(status_code=400, detail="Search query has no searchable words")
+    query = """
+        SELECT t.* FROM transactions_fts
+        JOIN transactions AS t ON t.transaction_id = transactions_fts.rowid
+        WHERE transactions_fts MATCH ?
+    """
+    params = [match]
+    if account_number:
+        query += " AND t.account_number = ?"
+        params.append(account_number)
+    query += " ORDER BY bm25(transactions_fts, 1.0, 2.0, 0.5), t.transaction_id DESC LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    def fetch(conn):
+        return conn.execute(query, params).fetchall()
+
+    transactions = await run_db(fetch)
+    return Response(content=transaction_encoder.encode_rows(transactions), media_type="application/json")
 
 @app.post("/transactions/{transaction_id}/retry", response_model=RetryResponse)
 async def retry_failed_transaction(transaction_id: int, token: str = Depends(verify_token)):
     """Retry a failed transaction"""
-    with get_db() as conn:
+    monitor = get_monitor()
+
+    def retry(conn):
         # Check if transaction exists and is failed
         cursor = conn.execute("""
             SELECT * FROM transactions WHERE transaction_id = ? AND status = 'FAILED'
@@ -190,35 +440,44 @@ async def retry_failed_transaction(transaction_id: int, token: str = Depends(ver
                 detail="Transaction not found or not in failed status"
             )
         
+        # The retry is checked like a new transaction; a refusal keeps the row
+        # FAILED with the new reason, so this op must not raise
+        refresh_client_limits(conn)
+        now = datetime.now()
+        reason = monitor.check(transaction['account_number'], transaction['transaction_type'],
+                               transaction['channel'], transaction['amount'], now)
+        if reason is not None:
+            conn.execute("""
+                UPDATE transactions SET failure_reason = ? WHERE transaction_id = ?
+            """, (reason, transaction_id))
+            return None, reason
+
         # Simulate retry logic - in real implementation, this would involve
         # actual payment processing, balance checks, etc.
         new_status = "COMPLETED"  # Simulate successful retry
         
-        # Update transaction status
+        # Update transaction status; the retry is processed now, so it becomes
+        # the latest entry in the account's balance history. Date and time move
+        # with created_at so the row stays consistent for date-range queries.
         conn.execute("""
             UPDATE transactions 
-            SET status = ?, failure_reason = NULL
+            SET status = ?, failure_reason = NULL,
+                transaction_date = ?, transaction_time = ?, created_at = ?
             WHERE transaction_id = ?
-        """, (new_status, transaction_id))
+        """, (new_status, now.date(), now.time().isoformat(), now, transaction_id))
         
         # If it's a balance-affecting transaction, update balance_after
         if transaction['transaction_type'] in ['DEPOSIT', 'WITHDRAWAL', 'TRANSFER_IN', 'TRANSFER_OUT']:
-            # Get current balance
-            balance_cursor = conn.execute("""
-                SELECT balance_after FROM transactions 
-                WHERE account_number = ? AND status = 'COMPLETED' AND balance_after IS NOT NULL
-                ORDER BY created_at DESC, transaction_id DESC
-                LIMIT 1
-            """, (transaction['account_number'],))
-            
-            current_balance_row = balance_cursor.fetchone()
-            current_balance = Decimal('0.00') if not current_balance_row else Decimal(str(current_balance_row['balance_after']))
+            current_balance = ledger.balance_or_zero(conn, transaction['account_number'])
             
-            # Calculate new balance
-            if transaction['transaction_type'] in ['DEPOSIT', 'TRANSFER_IN']:
-                new_balance = current_balance + Decimal(str(transaction['amount']))
-            else:  # WITHDRAWAL, TRANSFER_OUT
-                new_balance = current_balance - Decimal(str(transaction['amount']))
+            try:
+                new_balance = ledger.apply_amount(
+                    current_balance,
+                    transaction['transaction_type'],
+                    Decimal(str(transaction['amount'])),
+                )
+            except ledger.InsufficientFunds:
+                raise HTTPException(status_code=400, detail="Insufficient funds")
             
             conn.execute("""
                 UPDATE transactions 
@@ -226,42 +485,67 @@ async def retry_failed_transaction(transaction_id: int, token: str = Depends(ver
                 WHERE transaction_id = ?
             """, (str(new_balance), transaction_id))
         
-        conn.commit()
-        
-        return RetryResponse(
-            transaction_id=transaction_id,
-            old_status="FAILED",
-            new_status=new_status,
-            message="Transaction retried successfully"
-        )
+        # Counted as pending, like a created transaction
+        monitor.observe_row(conn.execute(
+            "SELECT * FROM transactions WHERE transaction_id = ?", (transaction_id,)
+        ).fetchone(), pending=True)
+        return new_status, None
+
+    new_status, reason = await get_writer().submit(retry)
+    if reason is not None:
+        monitor_rejections.inc(reason)
+        raise HTTPException(status_code=400, detail=f"Transaction refused: {reason}")
+    return RetryResponse(
+        transaction_id=transaction_id,
+        old_status="FAILED",
+        new_status=new_status,
+        message="Transaction retried successfully"
+    )
 
 @app.post("/transactions", response_model=TransactionResponse)
 async def create_transaction(transaction: TransactionCreate, token: str = Depends(verify_token)):
     """Create a new transaction"""
-    with get_db() as conn:
+    monitor = get_monitor()
+
+    def create(conn):
+        refresh_client_limits(conn)
+        now = datetime.now()
+        reason = monitor.check(transaction.account_number, transaction.transaction_type,
+                               transaction.channel, transaction.amount, now)
+        if reason is not None:
+            # Refused attempts are still recorded (rules.md 1.2), so this op must not raise
+            conn.execute("""
+                INSERT INTO transactions (
+                    account_number, transaction_date, transaction_time, transaction_type,
+                    amount, balance_after, description, counterparty_account, counterparty_name,
+                    channel, location, status, failure_reason, created_at
+                ) VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, 'FAILED', ?, ?)
+            """, (
+                transaction.account_number,
+                now.date(),
+                now.time().isoformat(),
+                transaction.transaction_type,
+                str(transaction.amount),
+                transaction.description,
+                transaction.counterparty_account,
+                transaction.counterparty_name,
+                transaction.channel,
+                transaction.location,
+                reason,
+                now
+            ))
+            return None, reason
+
         # Get current balance for balance calculation
-        cursor = conn.execute("""
-            SELECT balance_after FROM transactions 
-            WHERE account_number = ? AND status = 'COMPLETED' AND balance_after IS NOT NULL
-            ORDER BY created_at DESC, transaction_id DESC
-            LIMIT 1
-        """, (transaction.account_number,))
-        
-        current_balance_row = cursor.fetchone()
-        current_balance = Decimal('0.00') if not current_balance_row else Decimal(str(current_balance_row['balance_after']))
+        current_balance = ledger.balance_or_zero(conn, transaction.account_number)
         
         # Calculate new balance
-        if transaction.transaction_type in ['DEPOSIT', 'TRANSFER_IN', 'INTEREST']:
-            new_balance = current_balance + transaction.amount
-        elif transaction.transaction_type in ['WITHDRAWAL', 'TRANSFER_OUT', 'FEE']:
-            new_balance = current_balance - transaction.amount
-            if new_balance < 0:
-                raise HTTPException(status_code=400, detail="Insufficient funds")
-        else:  # CARD transactions
-            new_balance = current_balance - transaction.amount
+        try:
+            new_balance = ledger.apply_amount(current_balance, transaction.transaction_type, transaction.amount)
+        except ledger.InsufficientFunds:
+            raise HTTPException(status_code=400, detail="Insufficient funds")
         
         # Insert transaction
-        now = datetime.now()
         cursor = conn.execute("""
             INSERT INTO transactions (
                 account_number, transaction_date, transaction_time, transaction_type,
@@ -271,7 +555,7 @@ async def create_transaction(transaction: TransactionCreate, token: str = Depend
         """, (
             transaction.account_number,
             now.date(),
-            now.time(),
+            now.time().isoformat(),
             transaction.transaction_type,
             str(transaction.amount),
             str(new_balance),
@@ -284,18 +568,114 @@ async def create_transaction(transaction: TransactionCreate, token: str = Depend
         ))
         
         transaction_id = cursor.lastrowid
-        conn.commit()
         
         # Return the created transaction
         cursor = conn.execute("SELECT * FROM transactions WHERE transaction_id = ?", (transaction_id,))
-        created_transaction = cursor.fetchone()
-        
-        return TransactionResponse(**dict(created_transaction))
+        row = cursor.fetchone()
+        # Count it now so later ops in the same writer batch see it; the listener
+        # keeps the count once committed and takes it back if the op rolls back
+        monitor.observe_row(row, pending=True)
+        return row, None
+
+    created_transaction, reason = await get_writer().submit(create)
+    if reason is not None:
+        monitor_rejections.inc(reason)
+        raise HTTPException(status_code=400, detail=f"Transaction refused: {reason}")
+    return TransactionResponse(**dict(created_transaction))
+
+def _parse_batch_line(index: int, line: bytes, valid: list, results: dict):
+    try:
+        valid.append((index, TransactionCreate.model_validate_json(line)))
+    except ValidationError as exc:
+        error = "; ".join(
+            f"{'.'.join(str(part) for part in err['loc']) or 'body'}: {err['msg']}"
+            for err in exc.errors()
+        )
+        results[index] = BatchItemResult(index=index, success=False, error=error)
+
+@app.post("/transactions/batch", response_model=BatchResponse)
+async def create_transactions_batch(request: Request, token: str = Depends(verify_token)):
+    """Create many transactions from an NDJSON body (one TransactionCreate per line)"""
+    results = {}
+    valid = []
+    index = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            if index >= BATCH_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+            _parse_batch_line(index, line, valid, results)
+            index += 1
+    if buffer.strip():
+        if index >= BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+        _parse_batch_line(index, buffer, valid, results)
+        index += 1
+
+    monitor = get_monitor()
+
+    def post(conn, items):
+        refresh_client_limits(conn)
+        return ledger.post_transactions(conn, items, monitor=monitor)
+
+    # Apply in account order, keeping submission order within each account
+    valid.sort(key=lambda item: (item[1].account_number, item[0]))
+    for start in range(0, len(valid), BATCH_CHUNK_SIZE):
+        chunk = valid[start:start + BATCH_CHUNK_SIZE]
+        try:
+            outcomes = await get_writer().submit(post, [t.model_dump() for _, t in chunk])
+        except Exception as exc:
+            outcomes = [{"ok": False, "error": str(exc)}] * len(chunk)
+        for (item_index, _), outcome in zip(chunk, outcomes):
+            results[item_index] = BatchItemResult(
+                index=item_index,
+                success=outcome["ok"],
+                transaction_id=outcome.get("transaction_id"),
+                balance_after=outcome.get("balance_after"),
+                error=outcome.get("error"),
+                failure_reason=outcome.get("failure_reason"),
+            )
+            if outcome.get("failure_reason"):
+                monitor_rejections.inc(outcome["failure_reason"])
+
+    ordered = [results[i] for i in sorted(results)]
+    succeeded = sum(1 for r in ordered if r.success)
+    return BatchResponse(
+        received=index,
+        succeeded=succeeded,
+        failed=len(ordered) - succeeded,
+        results=ordered,
+    )
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
+    global _client_changes
     init_db()
+    # Opened before the limits are loaded so no change falls in between
+    _client_changes = ChangeFeed(DATABASE_PATH, MONITOR_CLIENT_POLL_SECONDS, tables=("clients",))
+    with get_db() as conn:
+        get_monitor().load(conn)
+    get_writer().subscribe(get_monitor().ledger_listener, get_monitor().savepoint)
+    get_writer().start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global _pool, _writer, _monitor, _client_changes
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+    _monitor = None
+    if _client_changes is not None:
+        _client_changes.close()
+        _client_changes = None
+    if _pool is not None:
+        _pool.close()
+        _pool = None
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,144 @@
+"""Compare the fast row encoder with the pydantic/response_model path.
+
+Checks that both paths produce byte-identical JSON for the same rows (including
+NULLs, float and integer amounts, fractional timestamps and non-ASCII text) and
+times a page of rows through each, end to end via FastAPI and encoder-only.
+
+    python -m benchmarks.serialization --rows 50 --iterations 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI, Response
+from pydantic import TypeAdapter
+
+from bank_api import TransactionResponse, transaction_encoder
+from migrations import migrate
+
+TYPES = ['DEPOSIT', 'WITHDRAWAL', 'TRANSFER_IN', 'TRANSFER_OUT', 'FEE', 'INTEREST', 'CARD']
+CHANNELS = ['ATM', 'ONLINE', 'MOBILE', 'BRANCH', 'CARD', 'AUTO']
+
+
+def build_database(path: str, rows: int, seed: int = 7):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    data = []
+    for i in range(rows):
+        amount = rnd.choice([rnd.randint(1, 5000), round(rnd.uniform(-3000, 3000), 2), 0.1 + 0.2, 1e-7])
+        created_at = f"2024-06-{1 + i % 28:02d} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}"
+        if i % 3 == 0:
+            created_at += f".{rnd.randint(0, 999999):06d}"
+        data.append((
+            'ACC-BENCH',
+            f"2024-06-{1 + i % 28:02d}",
+            rnd.choice(['09:15:00', '14:53:18.781552', '23:59:59.5']),
+            rnd.choice(TYPES),
+            amount,
+            None if i % 5 == 0 else rnd.choice([amount, 1722.35, 2500]),
+            rnd.choice([None, 'Coffee shop purchase', 'Café "Zürich" \\ tab\there', 'Rent\npayment']),
+            f"REF-{i}",
+            rnd.choice([None, 'EXT-987654321']),
+            rnd.choice([None, 'ABC Property Management', 'Пекарня №1']),
+            rnd.choice(CHANNELS),
+            rnd.choice([None, 'New York, NY']),
+            rnd.choice(['COMPLETED', 'FAILED', 'CANCELLED']),
+            rnd.choice([None, 'NETWORK_TIMEOUT']),
+            created_at,
+        ))
+    conn.executemany("""
+        INSERT INTO transactions (
+            account_number, transaction_date, transaction_time, transaction_type, amount,
+            balance_after, description, reference_number, counterparty_account,
+            counterparty_name, channel, location, status, failure_reason, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, data)
+    conn.commit()
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def build_app(conn: sqlite3.Connection, rows: int) -> FastAPI:
+    app = FastAPI()
+    query = "SELECT * FROM transactions ORDER BY created_at DESC, transaction_id DESC LIMIT ?"
+
+    @app.get("/models", response_model=List[TransactionResponse])
+    async def models():
+        return [TransactionResponse(**dict(t)) for t in conn.execute(query, (rows,)).fetchall()]
+
+    @app.get("/encoder", response_model=List[TransactionResponse])
+    async def encoder():
+        rows_ = conn.execute(query, (rows,)).fetchall()
+        return Response(content=transaction_encoder.encode_rows(rows_), media_type="application/json")
+
+    return app
+
+
+async def compare_and_time(app: FastAPI, iterations: int) -> dict:
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        reference = (await client.get("/models")).content
+        fast = (await client.get("/encoder")).content
+        results["identical"] = reference == fast
+        if not results["identical"]:
+            for i, (a, b) in enumerate(zip(reference, fast)):
+                if a != b:
+                    print("first difference at byte", i)
+                    print("  models :", reference[max(0, i - 80):i + 80])
+                    print("  encoder:", fast[max(0, i - 80):i + 80])
+                    break
+        for path in ("/models", "/encoder"):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                await client.get(path)
+            results[f"request {path}"] = (time.perf_counter() - started) / iterations
+    return results
+
+
+def time_encoders(conn: sqlite3.Connection, rows: int, iterations: int) -> dict:
+    page = conn.execute(
+        "SELECT * FROM transactions ORDER BY created_at DESC, transaction_id DESC LIMIT ?", (rows,)
+    ).fetchall()
+    adapter = TypeAdapter(List[TransactionResponse])
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        adapter.dump_json([TransactionResponse(**dict(t)) for t in page])
+    models = (time.perf_counter() - started) / iterations
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        transaction_encoder.encode_rows(page)
+    encoder = (time.perf_counter() - started) / iterations
+    return {"encode models": models, "encode rows": encoder}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50, help="rows per page")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build_database(os.path.join(tmp, "bench.db"), max(args.rows, 500))
+        results = asyncio.run(compare_and_time(build_app(conn, args.rows), args.iterations))
+        results.update(time_encoders(conn, args.rows, args.iterations))
+        conn.close()
+
+    print(f"byte-identical output: {results.pop('identical')}")
+    for name, seconds in results.items():
+        print(f"{name:20s} {seconds * 1e6:10.1f} us per {args.rows}-row page")
+    print(f"encoder speedup: {results['encode models'] / results['encode rows']:.1f}x, "
+          f"end to end: {results['request /models'] / results['request /encoder']:.1f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
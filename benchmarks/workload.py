@@ -0,0 +1,285 @@
+"""Mixed-workload benchmark for bank_api and the Toolbox SQL tools.
+
+Drives concurrent balance reads, listings, failed-transaction scans, creates and
+retries against ``bank_api.app`` in-process through an ASGI transport (no
+network), then times every read statement in tools_sqlite.yaml. Reports
+throughput and p50/p95/p99 latency; results can be saved as a baseline and
+later runs compared against it.
+
+    python -m benchmarks.workload --transactions 100000 --requests 5000 --save baseline.json
+    python -m benchmarks.workload --transactions 100000 --requests 5000 --compare baseline.json
+
+The database is generated with generate_ledger (same seed, same data), or copied
+from ``--db`` so the original is never written to.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import httpx
+import yaml
+
+import bank_api
+from generate_ledger import generate
+
+HEADERS = {"Authorization": "Bearer demo-token-123"}
+
+# Share of requests per operation
+MIX = {
+    "balance": 0.40,
+    "list": 0.30,
+    "failed_scan": 0.05,
+    "create": 0.20,
+    "retry": 0.05,
+}
+
+
+def percentile(ordered: list, q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(latencies: list, elapsed: float, errors: int = 0) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "throughput": len(ordered) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+    }
+
+
+def prepare_database(path: str, args) -> None:
+    if args.db:
+        shutil.copy(args.db, path)
+    else:
+        generate(path, args.transactions, args.accounts, seed=args.seed)
+
+
+class Workload:
+    """Request generators for each operation; the data pools are read up front"""
+
+    def __init__(self, path: str, seed: int):
+        conn = sqlite3.connect(path)
+        self.accounts = [r[0] for r in conn.execute("SELECT account_number FROM account_balances")]
+        self.failed = [r[0] for r in conn.execute(
+            "SELECT transaction_id FROM transactions WHERE status = 'FAILED' ORDER BY transaction_id"
+        )]
+        conn.close()
+        self.rng = random.Random(seed)
+        self.rng.shuffle(self.failed)
+        self.operations = list(MIX)
+        self.weights = [MIX[op] for op in self.operations]
+
+    def next(self):
+        op = self.rng.choices(self.operations, self.weights)[0]
+        account = self.rng.choice(self.accounts)
+        if op == "balance":
+            return op, "GET", f"/account/{account}/balance", None
+        if op == "list":
+            return op, "GET", f"/account/{account}/transactions", None
+        if op == "failed_scan":
+            return op, "GET", "/transactions/failed", None
+        if op == "retry" and self.failed:
+            return op, "POST", f"/transactions/{self.failed.pop()}/retry", None
+        transaction_type = self.rng.choice(["DEPOSIT", "CARD", "WITHDRAWAL", "TRANSFER_OUT"])
+        body = {
+            "account_number": account,
+            "transaction_type": transaction_type,
+            "amount": f"{self.rng.uniform(1, 200):.2f}",
+            "channel": "CARD" if transaction_type == "CARD" else "ONLINE",
+            "description": "Benchmark transaction",
+        }
+        return "create", "POST", "/transactions", body
+
+
+async def run_endpoints(requests: int, concurrency: int, workload: Workload) -> dict:
+    latencies = {op: [] for op in MIX}
+    errors = {op: 0 for op in MIX}
+    remaining = [requests]
+
+    async def worker(client: httpx.AsyncClient):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            op, method, url, body = workload.next()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body, headers=HEADERS)
+            latencies[op].append(time.perf_counter() - started)
+            # 400 (insufficient funds) and 404 (no balance yet) are valid business outcomes
+            if response.status_code >= 500:
+                errors[op] += 1
+
+    app = bank_api.app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        metrics = bank_api.get_pool().metrics()
+
+    results = {op: summarize(latencies[op], elapsed, errors[op]) for op in MIX if latencies[op]}
+    results["all"] = summarize([x for op in MIX for x in latencies[op]], elapsed, sum(errors.values()))
+    results["all"]["pool_wait_seconds_max"] = metrics["wait_seconds_max"]
+    return results
+
+
+def tool_arguments(tool: str, parameters: list, rng: random.Random, accounts: list, names: list):
+    """Plausible arguments for a tools_sqlite.yaml statement, by parameter name.
+
+    Raises ValueError for a parameter without a generator, so a new tool is
+    never silently left out of the benchmark.
+    """
+    begin = date(2024, 1, 1) + timedelta(days=rng.randrange(300))
+    values = {
+        "account_number": lambda: rng.choice(accounts),
+        "client_name": lambda: rng.choice(names).split()[0] if names else "A",
+        "begin_date": lambda: begin.isoformat(),
+        "end_date": lambda: (begin + timedelta(days=30)).isoformat(),
+        # get-account-summary: one month, or "" for all time
+        "month": lambda: rng.choice([begin.strftime("%Y-%m"), ""]),
+        "before_created_at": lambda: "9999-12-31",
+        "before_transaction_id": lambda: 0,
+        "limit": lambda: 50,
+        "status": lambda: "FAILED",
+        "text": lambda: rng.choice(["payment", "amazon", "salary", "abc property", "atm"]),
+    }
+    unknown = [p["name"] for p in parameters if p["name"] not in values]
+    if unknown:
+        raise ValueError(f"No benchmark arguments for {tool!r} parameters: {', '.join(unknown)}")
+    return [values[p["name"]]() for p in parameters]
+
+
+def run_tools(path: str, iterations: int, seed: int, tools_file: str = "tools_sqlite.yaml") -> dict:
+    """Time every read-only statement in the Toolbox catalogue against the database"""
+    with open(tools_file, encoding="utf-8") as f:
+        tools = yaml.safe_load(f)["tools"]
+    conn = sqlite3.connect(path)
+    accounts = [r[0] for r in conn.execute("SELECT account_number FROM account_balances")]
+    names = [r[0] for r in conn.execute("SELECT client_name FROM clients LIMIT 1000")]
+    rng = random.Random(seed)
+    results = {}
+    for name, tool in tools.items():
+        statement = tool["statement"].strip()
+        if not statement.upper().startswith("SELECT"):
+            continue
+        # Toolbox binds $N positionally; sqlite3 spells that ?N
+        statement = re.sub(r"\$(\d+)", r"?\1", statement)
+        latencies = []
+        for _ in range(iterations):
+            arguments = tool_arguments(name, tool.get("parameters", []), rng, accounts, names)
+            call_started = time.perf_counter()
+            conn.execute(statement, arguments).fetchall()
+            latencies.append(time.perf_counter() - call_started)
+        if latencies:
+            # Calls run back to back, so throughput is over time spent in SQLite only
+            results[name] = summarize(latencies, sum(latencies))
+    conn.close()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Print changes against ``baseline`` and return the regressions beyond ``threshold``"""
+    regressions = []
+    for section in ("endpoints", "tools"):
+        for name, now in current[section].items():
+            before = baseline.get(section, {}).get(name)
+            if before is None:
+                continue
+            changes = []
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput"):
+                if not before[metric]:
+                    continue
+                change = (now[metric] - before[metric]) / before[metric]
+                # Latency going up or throughput going down is a regression
+                worse = change if metric != "throughput" else -change
+                changes.append(f"{metric} {change:+.0%}")
+                if worse > threshold:
+                    regressions.append(f"{section}/{name} {metric}: {before[metric]:.3f} -> {now[metric]:.3f}")
+            print(f"  {section + '/' + name:50s} {'  '.join(changes)}")
+    return regressions
+
+
+def print_results(results: dict):
+    for section in ("endpoints", "tools"):
+        print(f"{section}:")
+        for name, r in results[section].items():
+            print(f"  {name:42s} n={r['count']:6d} {r['throughput']:9.1f}/s  p50 {r['p50_ms']:7.2f}ms  "
+                  f"p95 {r['p95_ms']:7.2f}ms  p99 {r['p99_ms']:7.2f}ms  errors {r['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="benchmark a copy of this database instead of generating one")
+    parser.add_argument("--transactions", type=int, default=50000)
+    parser.add_argument("--accounts", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--tool-iterations", type=int, default=200)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative change counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepare_database(path, args)
+        # Read the data pools before the workload starts writing
+        workload = Workload(path, args.seed)
+        bank_api.DATABASE_PATH = path
+        endpoints = asyncio.run(run_endpoints(args.requests, args.concurrency, workload))
+        tools = run_tools(path, args.tool_iterations, args.seed)
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "sqlite_version": sqlite3.sqlite_version,
+            "python": sys.version.split()[0],
+            "args": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+        },
+        "endpoints": endpoints,
+        "tools": tools,
+    }
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare} ({baseline['meta']['revision']}):")
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,63 +1,134 @@
-import streamlit as st
-import bs4
-from langchain import hub
-from langchain_core.documents import Document
-from langchain_community.document_loaders import WebBaseLoader, TextLoader, UnstructuredMarkdownLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langgraph.graph import START, StateGraph
-from typing_extensions import List, TypedDict
-from langgraph.checkpoint.memory import MemorySaver
-from toolbox_langchain import ToolboxClient
-from langchain_cohere import CohereEmbeddings
-from langchain_core.vectorstores import InMemoryVectorStore
-from langchain.tools.retriever import create_retriever_tool
-from langgraph.prebuilt import create_react_agent
 import os
+import time
+
+import streamlit as st
 
-from env import login
+import metrics
+from env import load_credentials
+from startup import PROFILE
 
+# Streamlit re-executes this script on every interaction. Everything expensive
+# (credentials, imports, index, tools, agent graph) is built once per process
+# by the st.cache_resource functions below; a rerun only redraws the page.
+rerun_started = time.perf_counter()
 st.title("Banking bot")
 
 ### INITIALIZE BOT
 
 
-#login()
-os.environ["COHERE_API_KEY"] = getpass.getpass("Enter API key for Cohere: ")
-os.environ["LANGSMITH_API_KEY"] =  getpass.getpass("Enter API key for LangSmith: ")
-os.environ["LANGSMITH_TRACING"] = "true"
-os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
-os.environ["LANGSMITH_PROJECT"] = "pr-drab-canvas-1"
-os.environ["ANTHROPIC_API_KEY"] =  getpass.getpass("Enter API key for Anthropic: ")
-embeddings = CohereEmbeddings(model="embed-english-v3.0")
-loader = UnstructuredMarkdownLoader("rules.md")
-vector_store = InMemoryVectorStore(embeddings)
-docs = loader.load()
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-all_splits = text_splitter.split_documents(docs)
-_ = vector_store.add_documents(documents=all_splits)
-retriever = vector_store.as_retriever()
-
-retriever_tool = create_retriever_tool(
-    retriever,
-    "retrieve_terms_of_service",
-    "You have access to the terms of services of a banking application. You can resolve user queries and ground them in rules. For example, when asked about interest rates you have to use infromation provided in the rules.",
-)
-
-client = ToolboxClient("http://127.0.0.1:5000")
-tools = client.load_toolset()
-tools.append(retriever_tool)
-
-config = {"configurable": {"thread_id": "thread-1"}}
-agent = create_react_agent(
-    model="anthropic:claude-3-7-sonnet-latest",
-    tools=tools,
-    prompt="You are a helpful banking application assistant that may give access to the users' transactions, provide them with helpful material grounded in rules and terms of service documents. You can operate on database within reasonable limits and use external tools to assist customers.",
-    checkpointer=MemorySaver()
-)
-
-# Initialize chat history
+@st.cache_resource
+def get_credentials() -> list:
+    # Keys come from the environment or .env, never from a prompt
+    with PROFILE.stage("credentials"):
+        missing = load_credentials()
+    metrics.REGISTRY.register_collector("startup", PROFILE.collector())
+    return missing
+
+
+@st.cache_resource
+def get_tool_cache():
+    from tool_cache import ToolCache
+    cache = ToolCache()
+    # Writes by the bank API and other processes invalidate through the change feed
+    cache.watch(os.environ.get("BANK_DATABASE_PATH", "bank_transactions.db"))
+    metrics.REGISTRY.register_collector("tool_cache", metrics.tool_cache_collector(cache))
+    return cache
+
+
+@st.cache_resource
+def get_metrics_server():
+    # Scrape target for tool latency and cache counters, off unless a port is set
+    port = os.environ.get("AGENT_METRICS_PORT")
+    return metrics.serve(int(port)) if port else None
+
+
+@st.cache_resource
+def get_tool_provider():
+    # tools_sqlite.yaml tools run in this process on one connection pool
+    from tool_provider import ToolProvider
+    return ToolProvider("tools_sqlite.yaml")
+
+
+def load_tools():
+    # A Toolbox server is only used when AGENT_TOOLBOX_URL points at one
+    toolbox_url = os.environ.get("AGENT_TOOLBOX_URL")
+    if toolbox_url:
+        from toolbox_langchain import ToolboxClient
+        return ToolboxClient(toolbox_url).load_toolset()
+    return get_tool_provider().load_toolset()
+
+
+@st.cache_resource
+def get_retriever_tool():
+    with PROFILE.stage("import retriever"):
+        from hybrid_retriever import HybridSearch, create_terms_tool
+        from rules_index import RulesIndex, default_embeddings
+    with PROFILE.stage("rules index"):
+        # Persistent index: only chunks of rules.md that changed since the last build get embedded
+        embeddings, embeddings_model_id = default_embeddings()
+        rules_index = RulesIndex.build(embeddings, embeddings_model_id)
+        # BM25 + vector fusion so exact tokens like DAILY_LIMIT_EXCEEDED or BENEFIT rank well
+        rules_search = HybridSearch(rules_index)
+    return create_terms_tool(
+        rules_search,
+        "retrieve_terms_of_service",
+        "You have access to the terms of services of a banking application. You can resolve user queries and ground them in rules. For example, when asked about interest rates you have to use infromation provided in the rules.",
+    )
+
+
+@st.cache_resource
+def get_session_store():
+    # One checkpoint database shared by every browser session of this process
+    with PROFILE.stage("import sessions"):
+        from sessions import SessionStore
+    return SessionStore()
+
+
+@st.cache_resource
+def get_agent():
+    # One agent graph for every session; each session is its own checkpoint thread
+    with PROFILE.stage("import agent"):
+        from agent import Agent
+        from sessions import make_history_hook
+    with PROFILE.stage("toolset"):
+        # Read-only tools are served from the cache; write tools invalidate it
+        tools = get_tool_cache().wrap_all(load_tools())
+    retriever_tool = get_retriever_tool()
+    session_store = get_session_store()
+    with PROFILE.stage("agent graph"):
+        # Independent tool calls in one turn run concurrently (see agent.Agent)
+        return Agent(
+            model="anthropic:claude-3-7-sonnet-latest",
+            tools=tools + [retriever_tool],
+            prompt="You are a helpful banking application assistant that may give access to the users' transactions, provide them with helpful material grounded in rules and terms of service documents. You can operate on database within reasonable limits and use external tools to assist customers.",
+            checkpointer=session_store.checkpointer,
+            pre_model_hook=make_history_hook(),
+        )
+
+
+missing_keys = get_credentials()
+if missing_keys:
+    st.error(f"Missing {', '.join(missing_keys)}: set them in the environment or in .env")
+    st.stop()
+get_metrics_server()
+with st.spinner("Starting the assistant..."):
+    agent = get_agent()
+session_store = get_session_store()
+tool_cache = get_tool_cache()
+
+st.sidebar.toggle("Stream responses", value=True, key="stream_responses")
+with st.sidebar.expander("Tool cache"):
+    st.json(tool_cache.stats())
+with st.sidebar.expander("Startup"):
+    st.json(PROFILE.report())
+    st.caption(f"Page ready in {time.perf_counter() - rerun_started:.3f}s")
+
+# Initialize chat history; each browser session gets its own agent thread
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "thread_id" not in st.session_state:
+    from sessions import new_thread_id
+    st.session_state.thread_id = new_thread_id()
 
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
@@ -66,10 +137,60 @@ for message in st.session_state.messages:
 
 
 def answer_from_bot(prompt:str):
+    config = session_store.config(st.session_state.thread_id)
     response = agent.invoke({"messages": [{"role": "user", "content": prompt}]} ,config=config)
     return response['messages'][-1].content
 
-    
+
+def _chunk_text(chunk) -> str:
+    # Anthropic streams content as a list of blocks; only text blocks are shown
+    if isinstance(chunk.content, str):
+        return chunk.content
+    return "".join(
+        block.get("text", "") for block in chunk.content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
+def stream_answer(prompt: str, status, timings: dict):
+    """Yield answer tokens as the model produces them and report tool calls on ``status``.
+
+    Fills ``timings`` with ``ttft`` (seconds to the first token) and ``total``.
+    """
+    from langchain_core.messages import AIMessageChunk
+    config = session_store.config(st.session_state.thread_id)
+    start = time.perf_counter()
+    tool_started = {}
+    separate = False
+    for mode, payload in agent.stream({"messages": [{"role": "user", "content": prompt}]},
+                                      config=config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+                continue
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            timings.setdefault("ttft", time.perf_counter() - start)
+            if separate:
+                # Text before and after a round of tool calls goes in separate paragraphs
+                yield "\n\n"
+                separate = False
+            yield text
+            continue
+        for node, update in payload.items():
+            for message in (update or {}).get("messages", []):
+                if node == "agent":
+                    for call in getattr(message, "tool_calls", None) or []:
+                        tool_started[call["id"]] = time.perf_counter()
+                        status.update(label=f"Calling {call['name']}...")
+                        status.write(f"Calling `{call['name']}` with `{call['args']}`")
+                elif node == "tools":
+                    elapsed = time.perf_counter() - tool_started.pop(message.tool_call_id, start)
+                    status.write(f"`{message.name}` finished in {elapsed:.2f}s")
+                    separate = True
+    timings["total"] = time.perf_counter() - start
+
 
 # React to user input
 if prompt := st.chat_input("What is up?"):
@@ -77,9 +198,19 @@ if prompt := st.chat_input("What is up?"):
     st.chat_message("user").markdown(prompt)
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
-    response = answer_from_bot(prompt)#f"Echo: {prompt}"
     # Display assistant response in chat message container
     with st.chat_message("assistant"):
-        st.markdown(response)
+        timings = {}
+        if st.session_state.get("stream_responses", True):
+            status = st.status("Thinking...", expanded=False)
+            response = st.write_stream(stream_answer(prompt, status, timings))
+            status.update(label="Done", state="complete")
+        else:
+            start = time.perf_counter()
+            response = answer_from_bot(prompt)
+            st.markdown(response)
+            timings["total"] = time.perf_counter() - start
+        first_token = f"first token {timings['ttft']:.2f}s, " if "ttft" in timings else ""
+        st.caption(f"{first_token}total {timings['total']:.2f}s")
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -0,0 +1,215 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import List, Optional, Sequence
+
+# Pragmas applied to every pooled connection. WAL lets readers run alongside
+# the writer; NORMAL sync is durable across application crashes in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect(database: str, statement_cache_size: int = 256,
+            factory=sqlite3.Connection) -> sqlite3.Connection:
+    """Open a connection configured the way the pool expects it.
+
+    ``factory`` is a ``sqlite3.Connection`` subclass, e.g.
+    ``metrics.InstrumentedConnection`` to time every statement.
+    """
+    conn = sqlite3.connect(
+        database,
+        check_same_thread=False,
+        cached_statements=statement_cache_size,
+        factory=factory,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of reusable SQLite connections.
+
+    Queries are meant to run on the pool's own executor (see ``run``) so that
+    blocking sqlite3 calls never stall the event loop. The executor has as many
+    workers as the pool has connections, so a worker never waits on the pool
+    unless connections are borrowed directly through ``connection()``.
+    """
+
+    def __init__(self, database: str, size: int = 8, timeout: float = 10.0,
+                 statement_cache_size: int = 256, factory=sqlite3.Connection):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.statement_cache_size = statement_cache_size
+        self.factory = factory
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._queued = 0
+        self._acquired_total = 0
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+        self._timeouts_total = 0
+        self._closed = False
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+
+    def _acquire(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        conn = None
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            if self._idle.empty() and self._opened < self.size:
+                self._opened += 1
+                opening = True
+            else:
+                opening = False
+                self._waiting += 1
+        if opening:
+            try:
+                conn = connect(self.database, self.statement_cache_size, self.factory)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        else:
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._waiting -= 1
+                    self._timeouts_total += 1
+                raise PoolTimeout(f"No database connection available after {self.timeout}s")
+            finally:
+                if conn is not None:
+                    with self._lock:
+                        self._waiting -= 1
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._acquired_total += 1
+            self._wait_seconds_total += waited
+            self._wait_seconds_max = max(self._wait_seconds_max, waited)
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+            if self._closed:
+                self._opened -= 1
+                conn.close()
+                return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+        with self.connection() as conn:
+            return fn(conn, *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(conn, *args, **kwargs)`` on the pool executor"""
+        with self._lock:
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(self._call, fn, args, kwargs))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "pool_size": self.size,
+                "connections_open": self._opened,
+                "connections_in_use": self._in_use,
+                "connections_idle": self._idle.qsize(),
+                "waiting_for_connection": self._waiting,
+                "queue_depth": self._queued,
+                "acquired_total": self._acquired_total,
+                "timeouts_total": self._timeouts_total,
+                "wait_seconds_total": round(self._wait_seconds_total, 6),
+                "wait_seconds_max": round(self._wait_seconds_max, 6),
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self.executor.shutdown(wait=True)
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+class ChangeFeed:
+    """Writes made by other connections, read from the data_changes table.
+
+    ``PRAGMA data_version`` changes whenever another connection commits, so a
+    poll costs one pragma until something was written; then the (table,
+    account) pairs changed since the last poll are read by sequence number.
+    With ``tables`` only changes to those tables are reported.
+    """
+
+    def __init__(self, database: str, interval: float, tables: Optional[Sequence[str]] = None):
+        self.interval = interval
+        self.tables = tuple(tables) if tables else None
+        self._conn = sqlite3.connect(database, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._seq = self._conn.execute("SELECT coalesce(max(seq), 0) FROM data_changes").fetchone()[0]
+
+    def poll(self) -> List[tuple]:
+        """``(table, account_number)`` pairs written since the previous poll"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked < self.interval:
+                return []
+            self._checked = now
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version:
+                return []
+            self._version = version
+            rows = self._conn.execute(
+                "SELECT table_name, account_number, seq FROM data_changes WHERE seq > ?", (self._seq,)
+            ).fetchall()
+            if rows:
+                self._seq = max(row[2] for row in rows)
+            return [(table, account) for table, account, _ in rows
+                    if self.tables is None or table in self.tables]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
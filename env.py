@@ -1,6 +1,15 @@
 import os
 import getpass
 
+# Non-interactive credentials: KEY=VALUE lines of this file fill in variables
+# that are not already set in the environment
+ENV_FILE = os.environ.get("BANK_ENV_FILE", ".env")
+LANGSMITH_DEFAULTS = {
+    "LANGSMITH_ENDPOINT": "https://api.smith.langchain.com",
+    "LANGSMITH_PROJECT": "pr-drab-canvas-1",
+}
+
+
 def login():
     os.environ["COHERE_API_KEY"] = getpass.getpass("Enter API key for Cohere: ")
     os.environ["LANGSMITH_API_KEY"] = getpass.getpass("Enter API key for LangSmith: ")
@@ -8,3 +17,32 @@ def login():
     os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
     os.environ["LANGSMITH_PROJECT"] = "pr-drab-canvas-1"
     os.environ["ANTHROPIC_API_KEY"] = getpass.getpass("Enter API key for Anthropic: ")
+
+
+def required_keys() -> list:
+    """API keys the chat app cannot start without"""
+    keys = ["ANTHROPIC_API_KEY"]
+    if os.environ.get("RULES_EMBEDDINGS", "cohere") != "hashing":
+        keys.append("COHERE_API_KEY")
+    return keys
+
+
+def load_credentials(path: str = ENV_FILE) -> list:
+    """Load API keys without prompting; returns the required keys still missing.
+
+    Variables already in the environment win over ``path``. LangSmith tracing
+    is switched on only when a LangSmith key is available.
+    """
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, value = line.removeprefix("export ").split("=", 1)
+                os.environ.setdefault(key.strip(), value.strip().strip("'\""))
+    if os.environ.get("LANGSMITH_API_KEY"):
+        os.environ.setdefault("LANGSMITH_TRACING", "true")
+        for key, value in LANGSMITH_DEFAULTS.items():
+            os.environ.setdefault(key, value)
+    return [key for key in required_keys() if not os.environ.get(key)]
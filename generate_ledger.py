@@ -0,0 +1,396 @@
+import argparse
+import bisect
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+from migrations import migrate
+
+# Pragmas for a one-off bulk load into a fresh file: no rollback journal, no
+# fsyncs, big page cache. Unsafe for a live database; restored before migrating.
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+)
+
+# Tariffs per rules.md section 9: share of accounts, savings APY (%), minimum
+# balance for interest, monthly fee and balance that waives it, out-of-network
+# ATM fee, daily ATM / card / transfer limits, and an amount scale for activity.
+TARIFFS = {
+    "NORMAL": dict(share=0.70, apy=0.05, interest_minimum=500, monthly_fee=12, fee_waiver=1500,
+                   atm_fee=3.50, atm_limit=500, card_limit=2000, transfer_limit=5000, scale=1.0),
+    "BENEFIT": dict(share=0.22, apy=0.15, interest_minimum=1000, monthly_fee=25, fee_waiver=10000,
+                    atm_fee=2.50, atm_limit=1000, card_limit=5000, transfer_limit=15000, scale=3.0),
+    "VIP": dict(share=0.08, apy=0.35, interest_minimum=0, monthly_fee=0, fee_waiver=0,
+                atm_fee=0.0, atm_limit=2500, card_limit=10000, transfer_limit=50000, scale=10.0),
+}
+
+# Share of generated transactions per type. FEE and INTEREST are monthly and
+# land on the last day of the month.
+TYPE_WEIGHTS = {
+    "CARD": 0.40, "TRANSFER_OUT": 0.15, "WITHDRAWAL": 0.12, "DEPOSIT": 0.10,
+    "TRANSFER_IN": 0.13, "FEE": 0.05, "INTEREST": 0.05,
+}
+
+CHANNEL_WEIGHTS = {
+    "DEPOSIT": {"BRANCH": 0.4, "MOBILE": 0.3, "ONLINE": 0.2, "ATM": 0.1},
+    "WITHDRAWAL": {"ATM": 0.75, "BRANCH": 0.25},
+    "TRANSFER_IN": {"ONLINE": 0.5, "AUTO": 0.4, "MOBILE": 0.1},
+    "TRANSFER_OUT": {"ONLINE": 0.45, "MOBILE": 0.4, "AUTO": 0.1, "BRANCH": 0.05},
+    "CARD": {"CARD": 1.0},
+    "FEE": {"AUTO": 1.0},
+    "INTEREST": {"AUTO": 1.0},
+}
+
+# Failure reasons from rules.md section 2 drawn for random failures. Rule-driven
+# failures (INSUFFICIENT_FUNDS, the daily limits, ATM maintenance, fee waivers,
+# interest minimums) are decided from the simulated account state instead.
+RANDOM_FAILURES = {
+    "DEPOSIT": ["ACCOUNT_FROZEN", "INVALID_AMOUNT"],
+    "WITHDRAWAL": ["ACCOUNT_FROZEN", "CARD_EXPIRED", "INCORRECT_PIN", "INVALID_AMOUNT"],
+    "TRANSFER_IN": ["INVALID_SOURCE_ACCOUNT", "INSUFFICIENT_FUNDS_SOURCE", "NETWORK_TIMEOUT"],
+    "TRANSFER_OUT": ["INVALID_RECIPIENT_ACCOUNT", "COMPLIANCE_HOLD", "NETWORK_TIMEOUT",
+                     "RECIPIENT_BANK_UNAVAILABLE"],
+    "CARD": ["CARD_DECLINED_FRAUD_PROTECTION", "CARD_EXPIRED", "INVALID_MERCHANT", "CVV_MISMATCH",
+             "GEOGRAPHIC_RESTRICTION"],
+    "FEE": ["ACCOUNT_CLOSED"],
+    "INTEREST": ["CALCULATION_ERROR"],
+}
+FAILURE_RATE = 0.03
+CANCEL_RATE = 0.01
+PENDING_DAYS = 3
+# Card purchases may overdraw up to this many cents (rules.md 4.2); other debits may not
+OVERDRAFT_LIMIT = 50000
+
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David",
+               "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas",
+               "Sarah", "Charles", "Karen", "Nikita", "Olga", "Ahmed", "Mei", "Carlos", "Priya"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor",
+              "Moore", "Jackson", "Martin", "Savelev", "Ivanova", "Khan", "Chen", "Silva", "Patel"]
+MERCHANTS = ["Starbucks #1234", "Amazon.com", "Walmart Supercenter", "Shell Gas Station", "Target",
+             "Whole Foods Market", "Netflix", "Uber", "Apple Store", "CVS Pharmacy", "Home Depot",
+             "Delta Air Lines", "McDonald's", "Spotify", "IKEA"]
+PAYEES = ["ABC Property Management", "Electric Company", "Phone Company", "City Water Utility",
+          "State Farm Insurance", "Comcast Internet", "Investment Account", "Student Loan Servicer"]
+PAYERS = ["Acme Corp Payroll", "Globex Payroll", "Initech Payroll", "Own Account", "Family Transfer",
+          "Tax Refund", "Freelance Client"]
+CITIES = ["New York, NY", "Los Angeles, CA", "Chicago, IL", "Houston, TX", "Phoenix, AZ",
+          "Philadelphia, PA", "San Antonio, TX", "San Diego, CA", "Dallas, TX", "Online"]
+ATMS = ["Downtown ATM", "Mall ATM", "Airport ATM", "Main Branch ATM", "Station ATM"]
+BRANCHES = ["Main Branch", "Uptown Branch", "Westside Branch"]
+
+REFERENCE_PREFIX = {"DEPOSIT": "DEP", "WITHDRAWAL": "WTH", "TRANSFER_IN": "TRF", "TRANSFER_OUT": "TRF",
+                    "CARD": "CRD", "FEE": "FEE", "INTEREST": "INT"}
+CREDIT_TYPES = ("DEPOSIT", "TRANSFER_IN", "INTEREST")
+
+_INSERT_TRANSACTION = """
+    INSERT INTO transactions (
+        transaction_id, account_number, transaction_date, transaction_time, transaction_type,
+        amount, balance_after, description, reference_number, counterparty_account,
+        counterparty_name, channel, location, status, failure_reason, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_INSERT_CLIENT = """
+    INSERT INTO clients (client_id, client_name, account_number, interest_rate, daily_limit,
+                         normal_fee, tariff_type, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class _Chooser:
+    """Weighted choice through one uniform draw and a bisect"""
+
+    def __init__(self, weights: dict):
+        self.values = list(weights)
+        total = sum(weights.values())
+        self.cumulative = []
+        running = 0.0
+        for value in self.values:
+            running += weights[value] / total
+            self.cumulative.append(running)
+
+    def __call__(self, rng: random.Random):
+        return self.values[min(bisect.bisect(self.cumulative, rng.random()), len(self.values) - 1)]
+
+
+_TARIFF = _Chooser({name: t["share"] for name, t in TARIFFS.items()})
+_TYPE = _Chooser(TYPE_WEIGHTS)
+_CHANNEL = {t: _Chooser(w) for t, w in CHANNEL_WEIGHTS.items()}
+
+
+def account_sizes(rng: random.Random, transactions: int, accounts: int) -> list:
+    """Split ``transactions`` over ``accounts`` with a skewed (log-normal) activity level"""
+    weights = [rng.lognormvariate(0, 1) for _ in range(accounts)]
+    total = sum(weights)
+    sizes = [int(transactions * w / total) for w in weights]
+    # Hand the rounding remainder to the busiest accounts
+    for i in sorted(range(accounts), key=weights.__getitem__, reverse=True)[:transactions - sum(sizes)]:
+        sizes[i] += 1
+    return sizes
+
+
+def _month_end(day: date) -> date:
+    following = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return following - timedelta(days=1)
+
+
+def _cents(amount: float) -> int:
+    return max(1, int(round(amount * 100)))
+
+
+def _amount(rng: random.Random, transaction_type: str, tariff: dict, channel: str) -> int:
+    """Unsigned amount in cents"""
+    scale = tariff["scale"]
+    if transaction_type == "CARD":
+        return _cents(min(rng.lognormvariate(3.3, 0.9) * scale, 5000))
+    if transaction_type == "WITHDRAWAL":
+        if channel == "ATM":
+            # Cash in $20 notes
+            return 2000 * max(1, int(rng.lognormvariate(1.6, 0.7) * math.sqrt(scale)))
+        return _cents(min(rng.lognormvariate(5.0, 0.8) * scale, 20000))
+    if transaction_type == "TRANSFER_OUT":
+        return _cents(min(rng.lognormvariate(5.3, 0.9) * scale, 25000))
+    if transaction_type == "TRANSFER_IN":
+        return _cents(min(rng.lognormvariate(6.6, 0.6) * scale, 25000))
+    return _cents(min(rng.lognormvariate(5.8, 0.8) * scale, 50000))
+
+
+def _details(rng: random.Random, transaction_type: str, channel: str):
+    """(description, counterparty_account, counterparty_name, location)"""
+    if transaction_type == "CARD":
+        merchant = rng.choice(MERCHANTS)
+        location = "Online" if merchant in ("Amazon.com", "Netflix", "Spotify") else rng.choice(CITIES)
+        return "Card purchase", f"MERCH-{rng.randrange(1000):03d}", merchant, location
+    if transaction_type == "WITHDRAWAL":
+        location = rng.choice(ATMS) if channel == "ATM" else rng.choice(BRANCHES)
+        return ("ATM withdrawal" if channel == "ATM" else "Cash withdrawal"), None, None, location
+    if transaction_type == "TRANSFER_OUT":
+        payee = rng.choice(PAYEES)
+        return f"Payment to {payee}", f"EXT-{rng.randrange(10 ** 9):09d}", payee, None
+    if transaction_type == "TRANSFER_IN":
+        payer = rng.choice(PAYERS)
+        description = "Salary" if payer.endswith("Payroll") else f"Transfer from {payer}"
+        return description, f"EXT-{rng.randrange(10 ** 9):09d}", payer, None
+    location = rng.choice(BRANCHES) if channel == "BRANCH" else (rng.choice(ATMS) if channel == "ATM" else None)
+    return "Cash deposit" if channel in ("BRANCH", "ATM") else "Mobile check deposit", None, None, location
+
+
+def account_transactions(rng: random.Random, account_number: str, tariff_name: str, count: int,
+                         start: date, days: int, first_id: int) -> list:
+    """Rows for one account in time order, with running balances.
+
+    Balances only move on COMPLETED rows. Debits that would overdraw, ATM, card
+    and transfer spending beyond the tariff's daily limits, ATM use during the
+    2-4 AM maintenance window, waived monthly fees and interest below the
+    minimum balance fail with the matching reason; a small random share fails
+    with one of the type's other documented reasons.
+    """
+    tariff = TARIFFS[tariff_name]
+    end = start + timedelta(days=days - 1)
+    events = []
+    seen_months = set()
+    for i in range(count):
+        transaction_type = "DEPOSIT" if i == 0 else _TYPE(rng)
+        day = start + timedelta(days=rng.randrange(days) if i else 0)
+        seconds = rng.randrange(86400)
+        if transaction_type in ("FEE", "INTEREST"):
+            # One of each per month, posted by the batch on the last day
+            key = (transaction_type, day.year, day.month)
+            day = min(_month_end(day), end)
+            if key in seen_months:
+                transaction_type = "CARD"
+            else:
+                seen_months.add(key)
+                seconds = 8 * 3600 + 30 * 60 if transaction_type == "FEE" else 12 * 3600
+        events.append((day, seconds, transaction_type))
+    events.sort()
+
+    rows = []
+    balance = 0
+    spent = {}
+    pending_from = end - timedelta(days=PENDING_DAYS - 1)
+    for offset, (day, seconds, transaction_type) in enumerate(events):
+        transaction_id = first_id + offset
+        channel = "BRANCH" if offset == 0 else _CHANNEL[transaction_type](rng)
+        transaction_date = day.isoformat()
+        transaction_time = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+        failure = None
+
+        if transaction_type == "FEE":
+            cents = int(tariff["monthly_fee"] * 100)
+            description, counterparty_account, counterparty_name, location = \
+                "Monthly maintenance fee", None, None, None
+            if cents == 0 or balance >= tariff["fee_waiver"] * 100:
+                if tariff["atm_fee"] and rng.random() < 0.5:
+                    cents = int(tariff["atm_fee"] * 100)
+                    description = "ATM fee (out-of-network)"
+                else:
+                    cents = cents or 1500
+                    failure = "FEE_WAIVER_ACTIVE"
+        elif transaction_type == "INTEREST":
+            cents = int(balance * tariff["apy"] / 100 / 12)
+            description, counterparty_account, counterparty_name, location = \
+                "Monthly interest credit", None, None, None
+            if cents <= 0 or balance < tariff["interest_minimum"] * 100:
+                cents = max(cents, 1)
+                failure = "ACCOUNT_BELOW_MINIMUM"
+        else:
+            cents = _amount(rng, transaction_type, tariff, channel)
+            if offset == 0:
+                cents = max(cents, int(500 * tariff["scale"]) * 100)
+            description, counterparty_account, counterparty_name, location = \
+                _details(rng, transaction_type, channel)
+
+        credit = transaction_type in CREDIT_TYPES
+        limit_key = limit = None
+        if transaction_type == "WITHDRAWAL" and channel == "ATM":
+            limit_key, limit = ("ATM", transaction_date), tariff["atm_limit"]
+        elif transaction_type == "CARD":
+            limit_key, limit = ("CARD", transaction_date), tariff["card_limit"]
+        elif transaction_type == "TRANSFER_OUT":
+            limit_key, limit = ("TRANSFER", transaction_date), tariff["transfer_limit"]
+
+        roll = rng.random()
+        if failure is None:
+            if channel == "ATM" and 2 <= seconds // 3600 < 4:
+                failure = "SYSTEM_MAINTENANCE"
+            elif limit_key and spent.get(limit_key, 0) + cents > limit * 100:
+                failure = "TRANSFER_LIMIT_EXCEEDED" if limit_key[0] == "TRANSFER" else "DAILY_LIMIT_EXCEEDED"
+            elif not credit and cents > balance + (OVERDRAFT_LIMIT if transaction_type == "CARD" else 0):
+                failure = "INSUFFICIENT_FUNDS"
+            elif offset and roll < FAILURE_RATE:
+                failure = rng.choice(RANDOM_FAILURES[transaction_type])
+
+        if failure is not None:
+            status = "FAILED"
+        elif offset and roll < FAILURE_RATE + CANCEL_RATE and transaction_type not in ("FEE", "INTEREST"):
+            status, failure = "CANCELLED", "USER_CANCELLED"
+        elif day >= pending_from and roll > 1 - CANCEL_RATE and transaction_type not in ("FEE", "INTEREST"):
+            status = "PENDING"
+        else:
+            status = "COMPLETED"
+
+        balance_after = None
+        if status == "COMPLETED":
+            balance += cents if credit else -cents
+            balance_after = balance / 100
+            if limit_key:
+                spent[limit_key] = spent.get(limit_key, 0) + cents
+
+        rows.append((
+            transaction_id,
+            account_number,
+            transaction_date,
+            transaction_time,
+            transaction_type,
+            (cents if credit else -cents) / 100,
+            balance_after,
+            description,
+            f"{REFERENCE_PREFIX[transaction_type]}-{transaction_id}",
+            counterparty_account,
+            counterparty_name,
+            channel,
+            location,
+            status,
+            failure,
+            f"{transaction_date} {transaction_time}",
+        ))
+    return rows
+
+
+def generate(path: str, transactions: int, accounts: int, seed: int = 42, start: date = date(2024, 1, 1),
+             days: int = 365, chunk_size: int = 50000, progress=None) -> dict:
+    """Write a synthetic ledger to a new database at ``path`` and migrate it"""
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    accounts = max(1, min(accounts, transactions))
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(path)
+    for pragma in LOAD_PRAGMAS:
+        conn.execute(pragma)
+    # Tables only: secondary indexes, triggers and projections are built once,
+    # after the load, by the remaining migrations
+    migrate(conn, target=1)
+
+    sizes = account_sizes(rng, transactions, accounts)
+    clients = []
+    rows = []
+    next_id = 1
+    written = 0
+    for number, size in enumerate(sizes):
+        account_number = f"ACC-{200000000 + number:09d}"
+        tariff_name = _TARIFF(rng)
+        tariff = TARIFFS[tariff_name]
+        clients.append((
+            number + 1,
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            account_number,
+            tariff["apy"],
+            tariff["atm_limit"],
+            tariff["atm_fee"],
+            tariff_name,
+            f"{start.isoformat()} 00:00:00",
+        ))
+        if size:
+            rows.extend(account_transactions(rng, account_number, tariff_name, size, start, days, next_id))
+            next_id += size
+        if len(rows) >= chunk_size:
+            conn.executemany(_INSERT_TRANSACTION, rows)
+            conn.commit()
+            written += len(rows)
+            rows = []
+            if progress:
+                progress(written, transactions, time.perf_counter() - started)
+    conn.executemany(_INSERT_TRANSACTION, rows)
+    conn.executemany(_INSERT_CLIENT, clients)
+    conn.commit()
+    written += len(rows)
+    loaded = time.perf_counter() - started
+
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    version = migrate(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+    return {
+        "transactions": written,
+        "accounts": accounts,
+        "schema_version": version,
+        "load_seconds": round(loaded, 2),
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def _report(written: int, total: int, elapsed: float):
+    print(f"\r{written:,}/{total:,} rows, {written / elapsed:,.0f} rows/s", end="", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic bank ledger")
+    parser.add_argument("--db", default="bank_transactions_large.db")
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2024, 1, 1))
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--overwrite", action="store_true", help="replace an existing --db file")
+    args = parser.parse_args()
+
+    if args.overwrite:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    summary = generate(args.db, args.transactions, args.accounts, args.seed, args.start, args.days,
+                       args.chunk_size, progress=_report)
+    print(file=sys.stderr)
+    print(", ".join(f"{k}={v}" for k, v in summary.items()))
@@ -0,0 +1,147 @@
+import re
+from collections import Counter, defaultdict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
+
+from rules_index import RulesIndex, SearchHit
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens. Codes such as DAILY_LIMIT_EXCEEDED are kept whole
+    and also contribute their parts, so both spellings match."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        if "_" in token:
+            tokens.extend(part for part in token.split("_") if part)
+    return tokens
+
+
+class BM25Index:
+    """Inverted index with precomputed BM25 weights.
+
+    Each posting list stores the document ids and the full BM25 term weight for
+    that document, so scoring a query is one vectorized add per query term.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.size = len(texts)
+        term_counts = [Counter(tokenize(t)) for t in texts]
+        lengths = np.array([sum(c.values()) for c in term_counts], dtype=np.float32)
+        average = float(lengths.mean()) if self.size else 0.0
+        norm = k1 * (1 - b + b * lengths / average) if average else np.full(self.size, k1)
+
+        postings = defaultdict(list)
+        for doc_id, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+
+        self.postings = {}
+        for term, entries in postings.items():
+            ids = np.array([d for d, _ in entries], dtype=np.int32)
+            tf = np.array([t for _, t in entries], dtype=np.float32)
+            idf = np.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            self.postings[term] = (ids, (idf * tf * (k1 + 1) / (tf + norm[ids])).astype(np.float32))
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                ids, weights = posting
+                scores[ids] += weights
+        return scores
+
+
+def _min_max(scores: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    selected = scores[mask]
+    if selected.size == 0:
+        return scores
+    low, high = float(selected.min()), float(selected.max())
+    if high <= low:
+        return np.where(scores > low, 1.0, 0.0).astype(np.float32) if high > 0 else np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+class HybridSearch:
+    """Fuses BM25 and vector similarity over the chunks of a RulesIndex.
+
+    Both score vectors are min-max normalized over the candidate chunks and mixed
+    as ``alpha * vector + (1 - alpha) * bm25``. ``section`` restricts candidates to
+    chunks whose section or subsection heading contains it, e.g. "9.3" or
+    "Account Type Fee Structure".
+    """
+
+    def __init__(self, index: RulesIndex, alpha: float = 0.5):
+        self.index = index
+        self.alpha = alpha
+        self.bm25 = BM25Index([c["text"] for c in index.chunks])
+        self._headings = [
+            f"{c['metadata'].get('section', '')}\n{c['metadata'].get('subsection', '')}".lower()
+            for c in index.chunks
+        ]
+
+    def section_mask(self, section: Optional[str]) -> np.ndarray:
+        if not section:
+            return np.ones(len(self._headings), dtype=bool)
+        needle = section.lower().strip()
+        return np.array([needle in h for h in self._headings], dtype=bool)
+
+    def search(self, query: str, k: int = 4, section: Optional[str] = None) -> List[SearchHit]:
+        mask = self.section_mask(section)
+        if not mask.any():
+            return []
+        lexical = _min_max(self.bm25.scores(query), mask)
+        dense = _min_max(self.index.scores(query), mask)
+        fused = np.where(mask, self.alpha * dense + (1 - self.alpha) * lexical, -np.inf)
+        k = min(k, int(mask.sum()))
+        top = np.argpartition(-fused, k - 1)[:k]
+        top = top[np.argsort(-fused[top])]
+        return [
+            SearchHit(self.index.chunks[i]["text"], float(fused[i]), self.index.chunks[i]["metadata"])
+            for i in top
+        ]
+
+
+class HybridRetriever(BaseRetriever):
+    """LangChain retriever over HybridSearch"""
+
+    search: HybridSearch
+    k: int = 4
+    section: Optional[str] = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [
+            Document(page_content=hit.text, metadata={**hit.metadata, "score": hit.score})
+            for hit in self.search.search(query, self.k, self.section)
+        ]
+
+
+class TermsQuery(BaseModel):
+    query: str = Field(description="What to look up in the terms of service, e.g. 'ATM fee for BENEFIT'.")
+    section: Optional[str] = Field(
+        default=None,
+        description="Optional section number or heading to restrict the search to, "
+                    "e.g. '9.3' or 'Account Type Fee Structure'.",
+    )
+
+
+def create_terms_tool(search: HybridSearch, name: str, description: str, k: int = 4) -> StructuredTool:
+    """Retriever tool like ``create_retriever_tool`` that also accepts a section filter"""
+    def retrieve(query: str, section: Optional[str] = None) -> str:
+        return "\n\n".join(hit.text for hit in search.search(query, k, section))
+
+    return StructuredTool.from_function(
+        func=retrieve, name=name, description=description, args_schema=TermsQuery
+    )
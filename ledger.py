@@ -0,0 +1,458 @@
+import argparse
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Mapping, Optional, Sequence
+
+import db
+
+logger = logging.getLogger(__name__)
+
+CREDIT_TYPES = ('DEPOSIT', 'TRANSFER_IN', 'INTEREST')
+DEBIT_TYPES = ('WITHDRAWAL', 'TRANSFER_OUT', 'FEE', 'CARD')
+# Debits that are refused rather than allowed to overdraw the account
+OVERDRAFT_CHECKED_TYPES = ('WITHDRAWAL', 'TRANSFER_OUT', 'FEE')
+
+
+class InsufficientFunds(Exception):
+    pass
+
+# Latest completed balance per account, ordered the same way as the
+# account_balances triggers: by created_at, then transaction_id. Accounts whose
+# history was moved to the archive fall back to their balance checkpoint.
+_BALANCE_SOURCES = """
+    SELECT account_number, balance_after, transaction_id, created_at
+    FROM transactions
+    WHERE status = 'COMPLETED' AND balance_after IS NOT NULL
+"""
+_CHECKPOINT_SOURCE = """
+    UNION ALL
+    SELECT account_number, balance, last_transaction_id, as_of
+    FROM account_checkpoints
+"""
+
+
+def _latest_balances(conn: sqlite3.Connection) -> str:
+    # account_checkpoints only exists from schema version 8 (archive.py)
+    has_checkpoints = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'account_checkpoints'"
+    ).fetchone()
+    sources = _BALANCE_SOURCES + (_CHECKPOINT_SOURCE if has_checkpoints else "")
+    return f"""
+        SELECT account_number, balance_after, transaction_id, created_at
+        FROM (
+            SELECT account_number, balance_after, transaction_id, created_at,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY account_number
+                       ORDER BY created_at DESC, transaction_id DESC
+                   ) AS rn
+            FROM ({sources})
+        )
+        WHERE rn = 1
+    """
+
+
+def current_balance(conn: sqlite3.Connection, account_number: str) -> Optional[sqlite3.Row]:
+    """Primary-key lookup of the account_balances projection"""
+    return conn.execute("""
+        SELECT account_number, balance, last_transaction_id, updated_at
+        FROM account_balances
+        WHERE account_number = ?
+    """, (account_number,)).fetchone()
+
+
+def account_summary(conn: sqlite3.Connection, account_number: str,
+                    month: Optional[str] = None) -> Optional[dict]:
+    """Counts, totals and failure reasons from the account_stats tables.
+
+    ``month`` (YYYY-MM) selects one month; by default all months are added up.
+    Returns None when the account has no transactions in that range.
+    """
+    low, high = (month, month) if month else ("", "~")
+    row = conn.execute("""
+        SELECT SUM(transactions), SUM(completed), SUM(failed), SUM(cancelled), SUM(pending),
+               round(SUM(credits), 2), round(SUM(debits), 2)
+        FROM account_stats
+        WHERE account_number = ? AND month BETWEEN ? AND ?
+    """, (account_number, low, high)).fetchone()
+    if not row[0]:
+        return None
+    reasons = conn.execute("""
+        SELECT failure_reason, SUM(count) FROM account_failure_stats
+        WHERE account_number = ? AND month BETWEEN ? AND ?
+        GROUP BY failure_reason
+        ORDER BY 2 DESC, 1
+    """, (account_number, low, high)).fetchall()
+    balance = current_balance(conn, account_number)
+    return {
+        "account_number": account_number,
+        "month": month,
+        "total_transactions": row[0],
+        "completed_transactions": row[1],
+        "failed_transactions": row[2],
+        "cancelled_transactions": row[3],
+        "pending_transactions": row[4],
+        "total_credits": Decimal(str(row[5])),
+        "total_debits": Decimal(str(row[6])),
+        "current_balance": Decimal(str(balance[1])) if balance else None,
+        "failure_reasons": {reason: count for reason, count in reasons if count > 0},
+    }
+
+
+def balance_or_zero(conn: sqlite3.Connection, account_number: str) -> Decimal:
+    row = current_balance(conn, account_number)
+    return Decimal('0.00') if not row else Decimal(str(row[1]))
+
+
+def apply_amount(balance: Decimal, transaction_type: str, amount: Decimal) -> Decimal:
+    """Balance after posting ``amount``; the direction comes from the transaction type.
+
+    Amounts are stored signed by some writers and unsigned by others, so only the
+    magnitude is used. Raises InsufficientFunds for checked debits that would overdraw.
+    """
+    amount = abs(amount)
+    if transaction_type in CREDIT_TYPES:
+        return balance + amount
+    new_balance = balance - amount
+    if new_balance < 0 and transaction_type in OVERDRAFT_CHECKED_TYPES:
+        raise InsufficientFunds(f"Insufficient funds: balance {balance}, debit {amount}")
+    return new_balance
+
+
+_INSERT_POSTING = """
+    INSERT INTO transactions (
+        transaction_id, account_number, transaction_date, transaction_time, transaction_type,
+        amount, balance_after, description, reference_number, counterparty_account,
+        counterparty_name, channel, location, status, failure_reason, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def post_transactions(conn: sqlite3.Connection, items: Sequence[Mapping],
+                      now: Optional[datetime] = None, monitor=None) -> List[dict]:
+    """Post many COMPLETED transactions with one ``executemany``.
+
+    ``items`` are applied in the order given, so callers sort them by account and
+    time first. Running balances are tracked in memory, starting from the
+    projection, and items that would overdraw are rejected without being written.
+    With a ``monitor`` (monitor.TransactionMonitor) every item is checked first;
+    refused items are written as FAILED with their ``failure_reason``, and
+    posted ones are counted as pending as they go so later items see them. Transaction
+    ids are allocated up front, which needs the caller to hold the write lock
+    (run this through LedgerWriter). Returns one result per item.
+    """
+    now = now or datetime.now()
+    transaction_date = now.date().isoformat()
+    transaction_time = now.time().isoformat()
+    next_id = conn.execute("""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'transactions'), 0),
+                   COALESCE((SELECT MAX(transaction_id) FROM transactions), 0))
+    """).fetchone()[0] + 1
+
+    balances = {}
+    rows = []
+    results = []
+    for item in items:
+        account_number = item['account_number']
+        if account_number not in balances:
+            balances[account_number] = balance_or_zero(conn, account_number)
+        amount = Decimal(str(item['amount']))
+        reason = None
+        if monitor is not None:
+            reason = monitor.check(account_number, item['transaction_type'], item.get('channel'), amount, now)
+        if reason is None:
+            try:
+                new_balance = apply_amount(balances[account_number], item['transaction_type'], amount)
+            except InsufficientFunds as exc:
+                results.append({"ok": False, "error": str(exc)})
+                continue
+            balances[account_number] = new_balance
+        rows.append((
+            next_id,
+            account_number,
+            transaction_date,
+            transaction_time,
+            item['transaction_type'],
+            str(amount),
+            None if reason else str(new_balance),
+            item.get('description'),
+            item.get('reference_number'),
+            item.get('counterparty_account'),
+            item.get('counterparty_name'),
+            item.get('channel'),
+            item.get('location'),
+            'FAILED' if reason else 'COMPLETED',
+            reason,
+            now,
+        ))
+        if reason is not None:
+            results.append({"ok": False, "transaction_id": next_id, "error": f"Transaction refused: {reason}",
+                            "failure_reason": reason})
+        else:
+            if monitor is not None:
+                monitor.observe(next_id, account_number, item['transaction_type'], item.get('channel'),
+                                amount, now, pending=True)
+            results.append({"ok": True, "transaction_id": next_id, "balance_after": new_balance})
+        next_id += 1
+
+    conn.executemany(_INSERT_POSTING, rows)
+    return results
+
+
+def rebuild_balances(conn: sqlite3.Connection) -> int:
+    """Recompute account_balances from the ledger. Caller owns the transaction."""
+    conn.execute("DELETE FROM account_balances")
+    cursor = conn.execute(f"""
+        INSERT INTO account_balances (account_number, balance, last_transaction_id, updated_at)
+        SELECT account_number, balance_after, transaction_id, created_at
+        FROM ({_latest_balances(conn)})
+    """)
+    return cursor.rowcount
+
+
+def verify_balances(conn: sqlite3.Connection) -> List[dict]:
+    """Compare account_balances against the ledger and return every mismatch"""
+    rows = conn.execute(f"""
+        WITH latest AS ({_latest_balances(conn)})
+        SELECT l.account_number, l.balance_after, l.transaction_id,
+               p.balance, p.last_transaction_id
+        FROM latest AS l
+        LEFT JOIN account_balances AS p ON p.account_number = l.account_number
+        WHERE p.account_number IS NULL
+           OR l.transaction_id != p.last_transaction_id
+           OR l.balance_after != p.balance
+        UNION ALL
+        SELECT p.account_number, NULL, NULL, p.balance, p.last_transaction_id
+        FROM account_balances AS p
+        WHERE p.account_number NOT IN (SELECT account_number FROM latest)
+    """).fetchall()
+    return [
+        {
+            "account_number": r[0],
+            "ledger_balance": r[1],
+            "ledger_transaction_id": r[2],
+            "projected_balance": r[3],
+            "projected_transaction_id": r[4],
+        }
+        for r in rows
+    ]
+
+
+class LedgerWriter:
+    """Serialized writer for every ledger mutation, with group commit.
+
+    Callers submit ``op(conn, *args)`` callables and await their result. A single
+    task drains the queue in FIFO order (so each account's mutations apply in the
+    order they were submitted) and runs up to ``max_batch`` pending ops inside one
+    SQLite transaction on a dedicated thread and connection. Each op runs under its
+    own savepoint: an op that raises is rolled back on its own and its caller gets
+    the exception, while the rest of the batch shares a single commit.
+
+    Because ops run one at a time against the writer's connection, a balance read
+    inside an op always reflects every earlier op, which keeps overdraft checks
+    correct under concurrency.
+
+    Listeners registered with ``subscribe`` are called on the writer thread after
+    every batch with the transactions rows it committed (none when nothing was
+    written or the batch rolled back), so caches and monitors see every ledger
+    change without polling; a ``savepoint`` hook lets them take back what a
+    rolled-back op counted before the next op runs.
+    """
+
+    def __init__(self, database: str, max_batch: int = 256, statement_cache_size: int = 256,
+                 factory=sqlite3.Connection):
+        self.database = database
+        self.max_batch = max_batch
+        self.statement_cache_size = statement_cache_size
+        self.factory = factory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger-writer")
+        self._conn = None
+        self._queue = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._batches_total = 0
+        self._ops_total = 0
+        self._ops_failed_total = 0
+        self._max_batch_seen = 0
+        self._listeners = []
+        self._savepoints = []
+
+    def subscribe(self, listener, savepoint=None):
+        """Call ``listener(rows)`` after every batch with the transactions rows it committed.
+
+        ``savepoint()``, when given, is called before each op and returns a
+        callable that undoes the subscriber's own state if the op rolls back.
+        """
+        self._listeners.append(listener)
+        if savepoint is not None:
+            self._savepoints.append(savepoint)
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_connection)
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, op, *args):
+        """Queue ``op(conn, *args)`` for the writer and wait for its own result"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, args, future))
+        return await future
+
+    def run(self, op, *args):
+        """Run ``op(conn, *args)`` in its own transaction on the writer thread and return its result.
+
+        Blocking, and independent of the event loop ``submit`` uses, for callers
+        such as agent tools that start a new loop per turn. It is serialized with
+        the queued batches but not grouped with them.
+        """
+        ok, value = self._executor.submit(self._commit_batch, [(op, args, None)]).result()[0]
+        if not ok:
+            raise value
+        return value
+
+    def close(self):
+        """Close a writer that was only used through ``run``"""
+        self._executor.submit(self._close_connection).result()
+        self._executor.shutdown(wait=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._commit_batch, batch)
+            except Exception as exc:
+                outcomes = [(False, exc)] * len(batch)
+            for (_, _, future), (ok, value) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = db.connect(self.database, self.statement_cache_size, self.factory)
+            # Connection-local change log feeding the listeners
+            self._conn.executescript("""
+                CREATE TEMP TABLE IF NOT EXISTS ledger_changes (transaction_id INTEGER PRIMARY KEY);
+                CREATE TEMP TRIGGER IF NOT EXISTS ledger_changes_insert AFTER INSERT ON main.transactions
+                BEGIN INSERT OR IGNORE INTO ledger_changes VALUES (NEW.transaction_id); END;
+                CREATE TEMP TRIGGER IF NOT EXISTS ledger_changes_update AFTER UPDATE ON main.transactions
+                BEGIN INSERT OR IGNORE INTO ledger_changes VALUES (NEW.transaction_id); END;
+            """)
+        return self._conn
+
+    def _take_changes(self, conn: sqlite3.Connection) -> list:
+        if not self._listeners:
+            conn.execute("DELETE FROM temp.ledger_changes")
+            return []
+        rows = conn.execute("""
+            SELECT * FROM transactions
+            WHERE transaction_id IN (SELECT transaction_id FROM temp.ledger_changes)
+            ORDER BY transaction_id
+        """).fetchall()
+        conn.execute("DELETE FROM temp.ledger_changes")
+        return rows
+
+    def _notify(self, rows: list):
+        for listener in self._listeners:
+            try:
+                listener(rows)
+            except Exception:
+                logger.exception("ledger listener %r failed", listener)
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _commit_batch(self, batch) -> list:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        outcomes = []
+        try:
+            for op, args, _ in batch:
+                conn.execute("SAVEPOINT ledger_op")
+                undo = [savepoint() for savepoint in self._savepoints]
+                try:
+                    result = op(conn, *args)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO ledger_op")
+                    conn.execute("RELEASE ledger_op")
+                    for rollback in undo:
+                        rollback()
+                    outcomes.append((False, exc))
+                else:
+                    conn.execute("RELEASE ledger_op")
+                    outcomes.append((True, result))
+            changes = self._take_changes(conn)
+            conn.commit()
+        except Exception as exc:
+            conn.rollback()
+            outcomes = [(False, exc)] * len(batch)
+            changes = []
+        self._notify(changes)
+        with self._lock:
+            self._batches_total += 1
+            self._ops_total += len(batch)
+            self._ops_failed_total += sum(1 for ok, _ in outcomes if not ok)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+        return outcomes
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "batches_total": self._batches_total,
+                "ops_total": self._ops_total,
+                "ops_failed_total": self._ops_failed_total,
+                "max_batch_size": self._max_batch_seen,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the account_balances projection")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--db", default="bank_transactions.db")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == "rebuild":
+        with conn:
+            count = rebuild_balances(conn)
+        print(f"Rebuilt balances for {count} account(s)")
+    else:
+        mismatches = verify_balances(conn)
+        for m in mismatches:
+            print(
+                f"{m['account_number']}: ledger {m['ledger_balance']} (txn {m['ledger_transaction_id']}) "
+                f"!= projection {m['projected_balance']} (txn {m['projected_transaction_id']})"
+            )
+        print(f"{len(mismatches)} mismatch(es)")
+        conn.close()
+        raise SystemExit(1 if mismatches else 0)
+    conn.close()
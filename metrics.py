@@ -0,0 +1,416 @@
+import bisect
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Tuple
+
+# Latency buckets in seconds, from sub-millisecond SQL up to slow agent tools
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Statements slower than this are logged to the "bank.slow_query" logger; unset disables it
+SLOW_QUERY_MS = float(os.environ["BANK_SLOW_QUERY_MS"]) if os.environ.get("BANK_SLOW_QUERY_MS") else None
+# Distinct SQL statement labels; statements seen after that are counted as "other"
+SQL_STATEMENT_LABELS = int(os.environ.get("BANK_SQL_STATEMENT_LABELS", "200"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+slow_query_log = logging.getLogger("bank.slow_query")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labelvalues, value: float):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+        lines = self._header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collector callbacks, rendered in the Prometheus text format.
+
+    Collectors are for values that already live elsewhere (pool and writer
+    counters, cache stats): ``collector()`` returns ``(name, kind, help,
+    {((label, value), ...): sample})`` tuples and is called on every scrape.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, key: str, collector: Callable[[], Iterable[tuple]]):
+        """Add or replace the collector stored under ``key``"""
+        with self._lock:
+            self._collectors[key] = collector
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples.items():
+                    names = tuple(k for k, _ in labels)
+                    values = tuple(v for _, v in labels)
+                    lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# SQL instrumentation
+
+sql_seconds = REGISTRY.histogram(
+    "bank_sql_statement_seconds", "SQLite statement time including row fetches", ("statement",)
+)
+sql_rows = REGISTRY.counter(
+    "bank_sql_rows_total", "Rows returned (SELECT) or changed (DML) per statement", ("statement",)
+)
+OTHER_STATEMENT = "other"
+# Normalization, applied in this order: comments, string literals, numbered
+# and named placeholders, numbers, then lists of placeholders or tuples
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDERS = re.compile(r"\?\d+|[:@$][A-Za-z_]\w*|\$\d+")
+_NUMBERS = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w.])")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_TUPLES = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_WHITESPACE = re.compile(r"\s+")
+_statement_labels = {}
+_distinct_labels = set()
+_labels_lock = threading.Lock()
+
+
+def normalize_statement(sql: str) -> str:
+    """SQL with literals replaced by ``?``, lists collapsed and whitespace squeezed, cut to 160 chars"""
+    sql = _COMMENTS.sub(" ", sql)
+    sql = _STRINGS.sub("?", sql)
+    sql = _PLACEHOLDERS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _LISTS.sub("(?, ...)", sql)
+    sql = _TUPLES.sub(r"\1, ...", sql)
+    return _WHITESPACE.sub(" ", sql).strip()[:160]
+
+
+def statement_label(sql: str) -> str:
+    """``statement`` label of ``sql``: its normalized text, or "other" once
+    SQL_STATEMENT_LABELS distinct labels are in use"""
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = normalize_statement(sql)
+        with _labels_lock:
+            if label not in _distinct_labels:
+                if len(_distinct_labels) < SQL_STATEMENT_LABELS:
+                    _distinct_labels.add(label)
+                else:
+                    label = OTHER_STATEMENT
+            if len(_statement_labels) < 4096:
+                _statement_labels[sql] = label
+    return label
+
+
+def record_statement(sql: str, seconds: float, rows: int):
+    label = statement_label(sql)
+    sql_seconds.observe(seconds, label)
+    sql_rows.inc(label, amount=rows)
+    if SLOW_QUERY_MS is not None and seconds * 1000 >= SLOW_QUERY_MS:
+        slow_query_log.warning("slow query %.1f ms, %d row(s): %s", seconds * 1000, rows, label)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement from ``execute`` until its rows are fetched.
+
+    SQLite does most of a SELECT's work while rows are stepped, so the time spent
+    in ``fetch*`` is added to the statement. The measurement is recorded when the
+    rows run out, or when the cursor is reused, closed or collected.
+    """
+
+    _sql = None
+
+    def _start(self, sql: str, elapsed: float):
+        self._finish()
+        self._sql = sql
+        self._elapsed = elapsed
+        self._rows = 0
+
+    def _finish(self):
+        if self._sql is not None:
+            rows = self._rows if self.description is not None else max(self.rowcount, 0)
+            record_statement(self._sql, self._elapsed, rows)
+            self._sql = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._start(sql, time.perf_counter() - started)
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._start(sql, time.perf_counter() - started)
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            if row is None:
+                self._finish()
+            else:
+                self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            self._rows += len(rows)
+            if len(rows) < size:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # conn.execute(...).fetchone() leaves rows unread; record when the cursor goes away
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """``sqlite3.connect(factory=...)`` connection whose statements are timed.
+
+    ``Connection.execute`` in C bypasses a cursor subclass's ``execute``, so the
+    shortcuts are redefined here to go through InstrumentedCursor.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# HTTP requests
+
+http_seconds = REGISTRY.histogram(
+    "bank_http_request_seconds", "HTTP request latency until the last body chunk is sent",
+    ("method", "route", "status"),
+)
+
+
+class RequestMetrics:
+    """ASGI middleware recording ``http_seconds`` per route template.
+
+    The route is the matched path template (``/account/{account_number}/balance``),
+    so account numbers don't become label values; unmatched paths share one label.
+    Streaming responses are timed until their last chunk.
+    """
+
+    def __init__(self, app, histogram: Histogram = http_seconds):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+        recorded = [False]
+
+        def record():
+            if not recorded[0]:
+                recorded[0] = True
+                route = scope.get("route")
+                self.histogram.observe(
+                    time.perf_counter() - started,
+                    scope["method"], getattr(route, "path", "unmatched"), str(status[0]),
+                )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+
+
+# Agent tools
+
+tool_seconds = REGISTRY.histogram(
+    "agent_tool_call_seconds", "Agent tool call latency", ("tool", "outcome")
+)
+
+
+def tool_cache_collector(cache) -> Callable[[], Iterable[tuple]]:
+    """Collector exporting a ToolCache's counters"""
+    def collect():
+        stats = cache.stats()
+        return [
+            ("agent_tool_cache_hits_total", "counter", "Tool calls served from the cache", {(): stats["hits"]}),
+            ("agent_tool_cache_misses_total", "counter", "Tool calls that ran the tool", {(): stats["misses"]}),
+            ("agent_tool_cache_evictions_total", "counter", "Entries evicted by the LRU bound",
+             {(): stats["evictions"]}),
+            ("agent_tool_cache_invalidations_total", "counter", "Entries dropped by writes",
+             {(): stats["invalidations"]}),
+            ("agent_tool_cache_entries", "gauge", "Entries currently cached", {(): stats["entries"]}),
+        ]
+    return collect
+
+
+def serve(port: int, registry: Registry = REGISTRY, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Expose ``registry`` on http://host:port/metrics from a daemon thread.
+
+    For processes without their own web server, such as the Streamlit chat.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,390 @@
+import argparse
+import sqlite3
+from typing import Optional
+
+import ledger
+
+
+def _base_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_number TEXT NOT NULL,
+            transaction_date DATE NOT NULL,
+            transaction_time TIME NOT NULL,
+            transaction_type TEXT NOT NULL CHECK (transaction_type IN ('DEPOSIT', 'WITHDRAWAL', 'TRANSFER_IN', 'TRANSFER_OUT', 'FEE', 'INTEREST', 'CARD')),
+            amount DECIMAL(10, 2) NOT NULL,
+            balance_after DECIMAL(10, 2),
+            description TEXT,
+            reference_number TEXT UNIQUE,
+            counterparty_account TEXT,
+            counterparty_name TEXT,
+            channel TEXT CHECK (channel IN ('ATM', 'ONLINE', 'MOBILE', 'BRANCH', 'CARD', 'AUTO')),
+            location TEXT,
+            status TEXT NOT NULL DEFAULT 'COMPLETED' CHECK (status IN ('COMPLETED', 'FAILED', 'PENDING', 'CANCELLED')),
+            failure_reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS clients (
+            client_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_name TEXT NOT NULL,
+            account_number TEXT NOT NULL,
+            interest_rate DECIMAL(10, 2) NOT NULL,
+            daily_limit DECIMAL(10, 2) NOT NULL DEFAULT 500,
+            normal_fee DECIMAL(10, 2),
+            tariff_type TEXT CHECK (tariff_type IN ('NORMAL', 'BENEFIT', 'VIP')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# Upsert shared by the projection triggers. The WHERE clause keeps the row with
+# the latest (created_at, transaction_id), which is how the ledger orders balances.
+_UPSERT_BALANCE = """
+    INSERT INTO account_balances (account_number, balance, last_transaction_id, updated_at)
+    VALUES (NEW.account_number, NEW.balance_after, NEW.transaction_id, NEW.created_at)
+    ON CONFLICT (account_number) DO UPDATE SET
+        balance = excluded.balance,
+        last_transaction_id = excluded.last_transaction_id,
+        updated_at = excluded.updated_at
+    WHERE (excluded.updated_at, excluded.last_transaction_id)
+          >= (account_balances.updated_at, account_balances.last_transaction_id);
+"""
+
+
+def _account_balances(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS account_balances (
+            account_number TEXT PRIMARY KEY,
+            balance DECIMAL(12, 2) NOT NULL,
+            last_transaction_id INTEGER NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_account_status_created
+        ON transactions (account_number, status, created_at, transaction_id)
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_account_balances_insert
+        AFTER INSERT ON transactions
+        WHEN NEW.status = 'COMPLETED' AND NEW.balance_after IS NOT NULL
+        BEGIN {_UPSERT_BALANCE} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_account_balances_update
+        AFTER UPDATE OF status, balance_after, created_at ON transactions
+        WHEN NEW.status = 'COMPLETED' AND NEW.balance_after IS NOT NULL
+        BEGIN {_UPSERT_BALANCE} END
+    """)
+    ledger.rebuild_balances(conn)
+
+
+def _listing_indexes(conn):
+    # Keyset pagination order for account listings and the failed-transactions scan
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_account_created
+        ON transactions (account_number, created_at, transaction_id)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_status_created
+        ON transactions (status, created_at, transaction_id)
+    """)
+
+
+def _tool_indexes(conn):
+    # Newest-first listing across all accounts
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_created
+        ON transactions (created_at, transaction_id)
+    """)
+    # Date-range lookups scoped to one account, newest first
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_account_date
+        ON transactions (account_number, transaction_date, transaction_time, transaction_id)
+    """)
+    # Case-insensitive client-name lookups without a LIKE scan. The normalized
+    # copy is kept in step with client_name by triggers.
+    conn.execute("ALTER TABLE clients ADD COLUMN client_name_norm TEXT COLLATE NOCASE")
+    conn.execute("UPDATE clients SET client_name_norm = lower(trim(client_name))")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_clients_name_norm
+        ON clients (client_name_norm, account_number)
+    """)
+    for event in ("INSERT", "UPDATE OF client_name"):
+        name = "insert" if event == "INSERT" else "update"
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_clients_name_norm_{name}
+            AFTER {event} ON clients
+            BEGIN
+                UPDATE clients SET client_name_norm = lower(trim(NEW.client_name))
+                WHERE client_id = NEW.client_id;
+            END
+        """)
+
+
+_FTS_COLUMNS = "description, counterparty_name, location"
+
+
+def _transactions_fts(conn):
+    # External-content index: the text lives in transactions, the FTS table only
+    # stores the inverted index, keyed by transaction_id.
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            {_FTS_COLUMNS},
+            content='transactions', content_rowid='transaction_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    new_values = "NEW.transaction_id, NEW.description, NEW.counterparty_name, NEW.location"
+    old_values = "OLD.transaction_id, OLD.description, OLD.counterparty_name, OLD.location"
+    delete_old = f"""
+        INSERT INTO transactions_fts (transactions_fts, rowid, {_FTS_COLUMNS})
+        VALUES ('delete', {old_values});
+    """
+    insert_new = f"INSERT INTO transactions_fts (rowid, {_FTS_COLUMNS}) VALUES ({new_values});"
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert
+        AFTER INSERT ON transactions BEGIN {insert_new} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete
+        AFTER DELETE ON transactions BEGIN {delete_old} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update
+        AFTER UPDATE OF {_FTS_COLUMNS} ON transactions BEGIN {delete_old} {insert_new} END
+    """)
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
+
+def _reference_index(conn):
+    # Reference-number lookups: audit trails and idempotent batch postings (accrual.py)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transactions_reference
+        ON transactions (reference_number)
+    """)
+
+
+def _stats_upserts(row: str, sign: str) -> str:
+    """Add (sign '+1') or remove (sign '-1') one transactions row from the stats tables"""
+    credit = f"{row}.transaction_type IN {ledger.CREDIT_TYPES}"
+    completed = f"{row}.status = 'COMPLETED'"
+    return f"""
+        INSERT INTO account_stats (account_number, month, transactions, completed, failed, cancelled,
+                                   pending, credits, debits)
+        VALUES ({row}.account_number, substr({row}.transaction_date, 1, 7), {sign},
+                {sign} * ({completed}), {sign} * ({row}.status = 'FAILED'),
+                {sign} * ({row}.status = 'CANCELLED'), {sign} * ({row}.status = 'PENDING'),
+                {sign} * (CASE WHEN {completed} AND {credit} THEN abs({row}.amount) ELSE 0 END),
+                {sign} * (CASE WHEN {completed} AND NOT {credit} THEN abs({row}.amount) ELSE 0 END))
+        ON CONFLICT (account_number, month) DO UPDATE SET
+            transactions = transactions + excluded.transactions,
+            completed = completed + excluded.completed,
+            failed = failed + excluded.failed,
+            cancelled = cancelled + excluded.cancelled,
+            pending = pending + excluded.pending,
+            credits = round(credits + excluded.credits, 2),
+            debits = round(debits + excluded.debits, 2);
+        INSERT INTO account_failure_stats (account_number, month, failure_reason, count)
+        SELECT {row}.account_number, substr({row}.transaction_date, 1, 7), {row}.failure_reason, {sign}
+        WHERE {row}.failure_reason IS NOT NULL AND {row}.status <> 'COMPLETED'
+        ON CONFLICT (account_number, month, failure_reason) DO UPDATE SET count = count + excluded.count;
+    """
+
+
+def _account_stats(conn):
+    # Counts and totals per account and month (of transaction_date), kept by
+    # triggers so summaries are primary-key lookups instead of ledger scans.
+    # Credits and debits are unsigned, completed transactions only; failure
+    # reasons are counted for transactions that did not complete.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS account_stats (
+            account_number TEXT NOT NULL,
+            month TEXT NOT NULL,
+            transactions INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            pending INTEGER NOT NULL DEFAULT 0,
+            credits REAL NOT NULL DEFAULT 0,
+            debits REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_number, month)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS account_failure_stats (
+            account_number TEXT NOT NULL,
+            month TEXT NOT NULL,
+            failure_reason TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_number, month, failure_reason)
+        ) WITHOUT ROWID
+    """)
+    remove_empty = """
+        DELETE FROM account_stats
+        WHERE account_number = OLD.account_number AND month = substr(OLD.transaction_date, 1, 7)
+          AND transactions <= 0;
+        DELETE FROM account_failure_stats
+        WHERE account_number = OLD.account_number AND month = substr(OLD.transaction_date, 1, 7)
+          AND failure_reason = OLD.failure_reason AND count <= 0;
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_account_stats_insert
+        AFTER INSERT ON transactions BEGIN {_stats_upserts("NEW", "+1")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_account_stats_update
+        AFTER UPDATE OF account_number, transaction_date, transaction_type, amount, status, failure_reason
+        ON transactions
+        BEGIN {_stats_upserts("OLD", "-1")} {remove_empty} {_stats_upserts("NEW", "+1")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_account_stats_delete
+        AFTER DELETE ON transactions BEGIN {_stats_upserts("OLD", "-1")} {remove_empty} END
+    """)
+    conn.execute("DELETE FROM account_stats")
+    conn.execute("DELETE FROM account_failure_stats")
+    conn.execute(f"""
+        INSERT INTO account_stats (account_number, month, transactions, completed, failed, cancelled,
+                                   pending, credits, debits)
+        SELECT account_number, substr(transaction_date, 1, 7), COUNT(*),
+               SUM(status = 'COMPLETED'), SUM(status = 'FAILED'),
+               SUM(status = 'CANCELLED'), SUM(status = 'PENDING'),
+               round(SUM(CASE WHEN status = 'COMPLETED' AND transaction_type IN {ledger.CREDIT_TYPES}
+                              THEN abs(amount) ELSE 0 END), 2),
+               round(SUM(CASE WHEN status = 'COMPLETED' AND transaction_type NOT IN {ledger.CREDIT_TYPES}
+                              THEN abs(amount) ELSE 0 END), 2)
+        FROM transactions
+        GROUP BY 1, 2
+    """)
+    conn.execute("""
+        INSERT INTO account_failure_stats (account_number, month, failure_reason, count)
+        SELECT account_number, substr(transaction_date, 1, 7), failure_reason, COUNT(*)
+        FROM transactions
+        WHERE failure_reason IS NOT NULL AND status <> 'COMPLETED'
+        GROUP BY 1, 2, 3
+    """)
+
+
+def _ledger_archive(conn):
+    # Hot/cold partitioning (archive.py). Months moved to the archive are
+    # registered here; readers ignore archive files of unregistered months.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_months (
+            month TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            first_created_at TIMESTAMP,
+            last_created_at TIMESTAMP,
+            archived_at TIMESTAMP NOT NULL
+        )
+    """)
+    # Last completed balance of each account among its archived transactions,
+    # so balances can be rebuilt without the rows that left the hot table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS account_checkpoints (
+            account_number TEXT PRIMARY KEY,
+            balance DECIMAL(12, 2) NOT NULL,
+            last_transaction_id INTEGER NOT NULL,
+            as_of TIMESTAMP NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+def _record_change(table: str, account: str, when: str = "1") -> str:
+    return f"""
+        INSERT INTO data_changes (table_name, account_number, seq)
+        SELECT '{table}', {account}, (SELECT coalesce(max(seq), 0) + 1 FROM data_changes)
+        WHERE {when}
+        ON CONFLICT (table_name, account_number) DO UPDATE SET seq = excluded.seq;
+    """
+
+
+def _data_changes(conn):
+    # Change feed for caches in other processes (db.ChangeFeed): the
+    # sequence number of the last write per table and account
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_changes (
+            table_name TEXT NOT NULL,
+            account_number TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            PRIMARY KEY (table_name, account_number)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_data_changes_seq ON data_changes (seq)")
+    for table in ("transactions", "clients"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_changes_insert
+            AFTER INSERT ON {table} BEGIN {_record_change(table, "NEW.account_number")} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_changes_update
+            AFTER UPDATE ON {table} BEGIN
+                {_record_change(table, "NEW.account_number")}
+                {_record_change(table, "OLD.account_number", "OLD.account_number IS NOT NEW.account_number")}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_changes_delete
+            AFTER DELETE ON {table} BEGIN {_record_change(table, "OLD.account_number")} END
+        """)
+
+
+def _archive_versions(conn):
+    # Each archive run writes a new directory, registered with the month in
+    # the same transaction; NULL is the original ARCHIVE_DIR/YYYY-MM layout
+    conn.execute("ALTER TABLE archived_months ADD COLUMN directory TEXT")
+
+
+# (version, description, apply). Append only; never edit a released migration.
+MIGRATIONS = [
+    (1, "base transactions and clients tables", _base_schema),
+    (2, "account_balances projection", _account_balances),
+    (3, "keyset pagination indexes", _listing_indexes),
+    (4, "indexes for the bounded tool catalogue", _tool_indexes),
+    (5, "full-text index over transaction descriptions", _transactions_fts),
+    (6, "reference number index", _reference_index),
+    (7, "per-account monthly statistics", _account_stats),
+    (8, "ledger archive registry and balance checkpoints", _ledger_archive),
+    (9, "data change feed for cross-process cache invalidation", _data_changes),
+    (10, "versioned archive directories", _archive_versions),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """Apply pending migrations up to ``target`` (default: all), each in its own
+    transaction. Returns the new version."""
+    for version, description, apply in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        if target is not None and version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if version > schema_version(conn):
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the bank database")
+    parser.add_argument("--db", default="bank_transactions.db")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    before = schema_version(conn)
+    after = migrate(conn)
+    conn.close()
+    print(f"{args.db}: schema version {before} -> {after}")
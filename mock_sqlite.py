@@ -2,6 +2,8 @@ import sqlite3
 from datetime import datetime, date
 import random
 
+from migrations import migrate
+
 # Connect to SQLite database (creates file if it doesn't exist)
 conn = sqlite3.connect('bank_transactions.db')
 cursor = conn.cursor()
@@ -109,6 +111,9 @@ cursor.executemany('''
 # Commit changes
 conn.commit()
 
+# Bring the schema up to date (balance projection, indexes, triggers)
+migrate(conn)
+
 # Query examples
 print("=== Bank Transaction Database Schema Created ===\n")
 
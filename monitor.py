@@ -0,0 +1,285 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, List, Optional
+
+# Monitor configuration: a debit is refused when the account already made
+# VELOCITY_MAX debits within the last VELOCITY_WINDOW_SECONDS
+VELOCITY_WINDOW_SECONDS = float(os.environ.get("BANK_MONITOR_VELOCITY_WINDOW_SECONDS", "60"))
+VELOCITY_MAX = int(os.environ.get("BANK_MONITOR_VELOCITY_MAX", "10"))
+
+# Daily limits in dollars per tariff (rules.md section 9). The client's own
+# daily_limit, when set, replaces the ATM limit.
+TARIFF_LIMITS = {
+    "NORMAL": dict(atm=500, card=2000, transfer_day=5000, transfer_month=25000),
+    "BENEFIT": dict(atm=1000, card=5000, transfer_day=15000, transfer_month=75000),
+    "VIP": dict(atm=2500, card=10000, transfer_day=50000, transfer_month=250000),
+}
+# Limits that hold for every tariff (rules.md sections 2.2 and 3.3)
+WITHDRAWAL_DAILY_LIMIT = 2500
+MOBILE_DEPOSIT_DAILY_LIMIT = 5000
+DEBIT_TYPES = ("WITHDRAWAL", "TRANSFER_OUT", "CARD")
+# Transaction ids already counted, so a row reported twice (by the op that
+# wrote it and again by the writer's listener) is counted once
+SEEN_MAX = 100000
+
+
+def _cents(amount) -> int:
+    return int(abs(Decimal(str(amount))) * 100)
+
+
+class _Window:
+    """Running totals of one account for the current day and month, in cents"""
+
+    __slots__ = ("day", "atm", "withdrawn", "card", "transferred", "mobile_deposits",
+                 "month", "transferred_month", "recent")
+
+    def __init__(self, velocity_max: int):
+        self.month = None
+        self.transferred_month = 0
+        self.recent = deque(maxlen=velocity_max)
+        self._reset_day(None)
+
+    def _reset_day(self, day: Optional[date]):
+        self.day = day
+        self.atm = self.withdrawn = self.card = self.transferred = self.mobile_deposits = 0
+
+    def roll(self, at: datetime):
+        """Start new day and month totals when ``at`` is past the current ones"""
+        day = at.date()
+        if self.day is None or day > self.day:
+            self._reset_day(day)
+            month = (day.year, day.month)
+            if month != self.month:
+                self.month = month
+                self.transferred_month = 0
+
+
+class TransactionMonitor:
+    """Per-account daily limits and velocity checks in constant time.
+
+    Each account keeps tumbling day and month totals (ATM and all withdrawals,
+    card spend, transfers, mobile deposits) and the times of its last
+    ``VELOCITY_MAX`` debits, so ``check`` never touches the database. ``load``
+    rebuilds the windows from the current month's completed transactions;
+    after that, ``observe`` (or ``ledger_listener`` on a LedgerWriter) keeps
+    them current, and ``set_client`` or ``reload_clients`` the client limits.
+
+    A writer op counts what it writes with ``pending=True`` so later ops in
+    the same batch see it. Subscribed with ``savepoint``, the counts of an op
+    that rolls back are taken back at once; after the batch, ``ledger_listener``
+    keeps the pending transactions that were committed and takes back the rest.
+    """
+
+    def __init__(self, velocity_window: float = VELOCITY_WINDOW_SECONDS, velocity_max: int = VELOCITY_MAX):
+        self.velocity_window = velocity_window
+        self.velocity_max = velocity_max
+        self._windows = {}
+        self._clients = {}
+        self._seen = OrderedDict()
+        # Counted but not committed yet: transaction_id -> (account, type, channel, cents, at, evicted)
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, conn: sqlite3.Connection, now: Optional[datetime] = None,
+             accounts: Optional[Iterable[str]] = None) -> int:
+        """Rebuild client limits and windows from the database; returns the rows replayed.
+
+        With ``accounts``, only those accounts are read, e.g. for a monitor built
+        for one check in a process that doesn't keep one.
+        """
+        now = now or datetime.now()
+        where, params = "", []
+        if accounts is not None:
+            where = " AND account_number IN (SELECT value FROM json_each(?))"
+            params = [json.dumps(sorted(set(accounts)))]
+        with self._lock:
+            self._windows.clear()
+            self._seen.clear()
+            self._pending.clear()
+            self._clients = {
+                account_number: (tariff_type, daily_limit)
+                for account_number, tariff_type, daily_limit in conn.execute(
+                    "SELECT account_number, tariff_type, daily_limit FROM clients WHERE 1" + where
+                    + " ORDER BY client_id DESC", params
+                )
+            }
+        month_start = now.date().replace(day=1).isoformat()
+        rows = conn.execute(f"""
+            SELECT transaction_id, account_number, transaction_type, channel, amount, created_at
+            FROM transactions
+            WHERE created_at >= ? AND status = 'COMPLETED'{where}
+            ORDER BY created_at, transaction_id
+        """, [month_start] + params).fetchall()
+        for transaction_id, account_number, transaction_type, channel, amount, created_at in rows:
+            self.observe(transaction_id, account_number, transaction_type, channel, amount,
+                         datetime.fromisoformat(created_at))
+        return len(rows)
+
+    def set_client(self, account_number: str, tariff_type: str, daily_limit=None):
+        """Update the limits of an account after a tariff change"""
+        with self._lock:
+            self._clients[account_number] = (tariff_type, daily_limit)
+
+    def reload_clients(self, conn: sqlite3.Connection, accounts) -> int:
+        """Re-read the limits of ``accounts`` from the clients table; returns the accounts found"""
+        rows = conn.execute("""
+            SELECT account_number, tariff_type, daily_limit FROM clients
+            WHERE account_number IN (SELECT value FROM json_each(?))
+            ORDER BY client_id DESC
+        """, (json.dumps(sorted(set(accounts))),)).fetchall()
+        for account_number, tariff_type, daily_limit in rows:
+            self.set_client(account_number, tariff_type, daily_limit)
+        return len({row[0] for row in rows})
+
+    def _limits(self, account_number: str) -> dict:
+        tariff_type, daily_limit = self._clients.get(account_number, ("NORMAL", None))
+        limits = dict(TARIFF_LIMITS.get(tariff_type, TARIFF_LIMITS["NORMAL"]))
+        if daily_limit is not None:
+            limits["atm"] = float(daily_limit)
+        return limits
+
+    def _window(self, account_number: str, at: datetime) -> _Window:
+        window = self._windows.get(account_number)
+        if window is None:
+            window = self._windows[account_number] = _Window(self.velocity_max)
+        window.roll(at)
+        return window
+
+    def check(self, account_number: str, transaction_type: str, channel: str, amount,
+              at: Optional[datetime] = None) -> Optional[str]:
+        """The failure_reason this transaction would be refused with, or None"""
+        at = at or datetime.now()
+        cents = _cents(amount)
+        with self._lock:
+            window = self._window(account_number, at)
+            limits = self._limits(account_number)
+            if transaction_type in DEBIT_TYPES and len(window.recent) == self.velocity_max \
+                    and at.timestamp() - window.recent[0] < self.velocity_window:
+                return "CARD_DECLINED_FRAUD_PROTECTION" if transaction_type == "CARD" else "COMPLIANCE_HOLD"
+            if transaction_type == "WITHDRAWAL":
+                if channel == "ATM" and window.atm + cents > limits["atm"] * 100:
+                    return "ATM_LIMIT_EXCEEDED"
+                if window.withdrawn + cents > WITHDRAWAL_DAILY_LIMIT * 100:
+                    return "DAILY_LIMIT_EXCEEDED"
+            elif transaction_type == "CARD":
+                if window.card + cents > limits["card"] * 100:
+                    return "DAILY_LIMIT_EXCEEDED"
+            elif transaction_type == "TRANSFER_OUT":
+                if window.transferred + cents > limits["transfer_day"] * 100 \
+                        or window.transferred_month + cents > limits["transfer_month"] * 100:
+                    return "TRANSFER_LIMIT_EXCEEDED"
+            elif transaction_type == "DEPOSIT" and channel == "MOBILE":
+                if window.mobile_deposits + cents > MOBILE_DEPOSIT_DAILY_LIMIT * 100:
+                    return "DAILY_LIMIT_EXCEEDED"
+        return None
+
+    def observe(self, transaction_id: int, account_number: str, transaction_type: str, channel: str,
+                amount, at: datetime, pending: bool = False):
+        """Count a COMPLETED transaction; ids already counted are ignored.
+
+        With ``pending``, the transaction is not committed yet: it counts at
+        once, and ``settle`` keeps it or takes it back.
+        """
+        cents = _cents(amount)
+        with self._lock:
+            if transaction_id in self._seen or transaction_id in self._pending:
+                return
+            evicted = self._count(account_number, transaction_type, channel, cents, at, 1)
+            if pending:
+                self._pending[transaction_id] = (account_number, transaction_type, channel, cents, at, evicted)
+            else:
+                self._mark_seen(transaction_id)
+
+    def _mark_seen(self, transaction_id: int):
+        self._seen[transaction_id] = None
+        if len(self._seen) > SEEN_MAX:
+            self._seen.popitem(last=False)
+
+    def _count(self, account_number: str, transaction_type: str, channel: str, cents: int, at: datetime,
+               sign: int) -> Optional[float]:
+        """Add (sign 1) or take back (sign -1) a transaction; returns the debit time
+        it pushed out of the velocity window"""
+        window = self._window(account_number, at)
+        cents *= sign
+        if at.date() != window.day:
+            # Older than the current day: only the month total still applies
+            if transaction_type == "TRANSFER_OUT" and (at.year, at.month) == window.month:
+                window.transferred_month += cents
+            return None
+        evicted = None
+        if transaction_type in DEBIT_TYPES:
+            if sign > 0:
+                if len(window.recent) == self.velocity_max:
+                    evicted = window.recent[0]
+                window.recent.append(at.timestamp())
+            elif at.timestamp() in window.recent:
+                window.recent.remove(at.timestamp())
+        if transaction_type == "WITHDRAWAL":
+            window.withdrawn += cents
+            if channel == "ATM":
+                window.atm += cents
+        elif transaction_type == "CARD":
+            window.card += cents
+        elif transaction_type == "TRANSFER_OUT":
+            window.transferred += cents
+            window.transferred_month += cents
+        elif transaction_type == "DEPOSIT" and channel == "MOBILE":
+            window.mobile_deposits += cents
+        return evicted
+
+    def _take_back(self, transaction_id: int):
+        account_number, transaction_type, channel, cents, at, evicted = self._pending.pop(transaction_id)
+        self._count(account_number, transaction_type, channel, cents, at, -1)
+        window = self._windows[account_number]
+        if evicted is not None and len(window.recent) < self.velocity_max \
+                and (not window.recent or evicted <= window.recent[0]):
+            window.recent.appendleft(evicted)
+
+    def settle(self, committed: Iterable[int] = ()):
+        """Keep the pending transactions in ``committed`` and take back the rest"""
+        committed = set(committed)
+        with self._lock:
+            # Newest first, so each one gives back the debit time it pushed out
+            for transaction_id in reversed(list(self._pending)):
+                if transaction_id in committed:
+                    del self._pending[transaction_id]
+                    self._mark_seen(transaction_id)
+                else:
+                    self._take_back(transaction_id)
+
+    def savepoint(self):
+        """LedgerWriter savepoint hook: returns a callable that takes back what
+        was counted as pending since"""
+        with self._lock:
+            mark = len(self._pending)
+
+        def rollback():
+            with self._lock:
+                for transaction_id in reversed(list(self._pending)[mark:]):
+                    self._take_back(transaction_id)
+        return rollback
+
+    def observe_row(self, row, pending: bool = False):
+        if row["status"] == "COMPLETED":
+            created_at = row["created_at"]
+            if isinstance(created_at, str):
+                created_at = datetime.fromisoformat(created_at)
+            self.observe(row["transaction_id"], row["account_number"], row["transaction_type"],
+                         row["channel"], row["amount"], created_at, pending)
+
+    def ledger_listener(self, rows: List) -> None:
+        """LedgerWriter listener, called after every batch: settle the pending
+        transactions against the rows it committed and count the others"""
+        committed = [row["transaction_id"] for row in rows if row["status"] == "COMPLETED"]
+        self.settle(committed)
+        for row in rows:
+            self.observe_row(row)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"accounts": len(self._windows), "clients": len(self._clients)}
@@ -0,0 +1,251 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+RULES_PATH = "rules.md"
+INDEX_DIR = ".rules_index"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+_TOKEN = re.compile(r"\w+")
+_HEADING = re.compile(r"^(#{2,3}) (.+)$", re.MULTILINE)
+
+
+class HashingEmbeddings:
+    """Offline stand-in for an embeddings API.
+
+    Hashes word unigrams and bigrams into a fixed-size signed vector, so the index
+    can be built and queried deterministically without network access or keys.
+    Implements the ``embed_documents``/``embed_query`` pair LangChain expects.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    @property
+    def model_id(self) -> str:
+        return f"hashing-{self.dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = _TOKEN.findall(text.lower())
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+@dataclass
+class SearchHit:
+    text: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def split_rules(path: str = RULES_PATH, chunk_size: int = CHUNK_SIZE,
+                chunk_overlap: int = CHUNK_OVERLAP) -> List[Document]:
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+    )
+    documents = splitter.create_documents([text], metadatas=[{"source": path}])
+
+    # Tag each chunk with the "## N." section and "### N.M" subsection it starts in
+    headings = [(m.start(), len(m.group(1)), m.group(2).strip()) for m in _HEADING.finditer(text)]
+    for document in documents:
+        section = subsection = ""
+        for position, level, title in headings:
+            if position > document.metadata["start_index"]:
+                break
+            if level == 2:
+                section, subsection = title, ""
+            else:
+                subsection = title
+        document.metadata["section"] = section
+        document.metadata["subsection"] = subsection
+    return documents
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class RulesIndex:
+    """On-disk vector index over chunks of rules.md, keyed by chunk content hash.
+
+    ``index_dir`` holds ``chunks.json`` (hash, text and metadata per chunk, plus
+    the embedding model id) and ``vectors.f32``, a row-per-chunk float32 matrix
+    of L2-normalized vectors that is memory-mapped for search. Rebuilding only
+    embeds chunks whose hash is not already in the index.
+    """
+
+    def __init__(self, index_dir: str, embeddings, model_id: str, chunks: List[dict],
+                 vectors: np.ndarray):
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.chunks = chunks
+        self.vectors = vectors
+        self.embedded_on_build = 0
+
+    @classmethod
+    def _load_existing(cls, index_dir: str, model_id: str) -> dict:
+        """Map of chunk hash -> vector from a previous build with the same model"""
+        meta_path = os.path.join(index_dir, "chunks.json")
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model_id") != model_id or not meta["chunks"]:
+            return {}
+        vectors = np.memmap(os.path.join(index_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                            shape=(len(meta["chunks"]), meta["dim"]))
+        return {c["hash"]: np.array(vectors[i]) for i, c in enumerate(meta["chunks"])}
+
+    @classmethod
+    def build(cls, embeddings, model_id: Optional[str] = None, rules_path: str = RULES_PATH,
+              index_dir: str = INDEX_DIR, documents: Optional[List[Document]] = None) -> "RulesIndex":
+        """Bring the index in ``index_dir`` up to date with ``rules_path`` and open it"""
+        model_id = model_id or getattr(embeddings, "model_id", None) or type(embeddings).__name__
+        documents = documents if documents is not None else split_rules(rules_path)
+        existing = cls._load_existing(index_dir, model_id)
+
+        chunks = [
+            {"hash": chunk_hash(d.page_content), "text": d.page_content, "metadata": d.metadata}
+            for d in documents
+        ]
+        missing = list({c["hash"]: c["text"] for c in chunks if c["hash"] not in existing}.items())
+        if missing:
+            fresh = embeddings.embed_documents([text for _, text in missing])
+            for (h, _), vector in zip(missing, fresh):
+                existing[h] = np.asarray(vector, dtype=np.float32)
+
+        unchanged = not missing and os.path.exists(os.path.join(index_dir, "chunks.json")) and \
+            cls._stored_chunks(index_dir) == chunks
+        if not unchanged:
+            matrix = _normalize(np.stack([existing[c["hash"]] for c in chunks])) if chunks \
+                else np.zeros((0, 0), dtype=np.float32)
+            cls._write(index_dir, model_id, chunks, matrix)
+
+        index = cls.open(index_dir, embeddings)
+        index.embedded_on_build = len(missing)
+        return index
+
+    @staticmethod
+    def _stored_chunks(index_dir: str) -> List[dict]:
+        with open(os.path.join(index_dir, "chunks.json"), encoding="utf-8") as f:
+            return json.load(f)["chunks"]
+
+    @staticmethod
+    def _write(index_dir: str, model_id: str, chunks: List[dict], matrix: np.ndarray):
+        os.makedirs(index_dir, exist_ok=True)
+        # Write under temporary names first so a crash never leaves a half-written file
+        vectors_tmp = os.path.join(index_dir, "vectors.f32.tmp")
+        meta_tmp = os.path.join(index_dir, "chunks.json.tmp")
+        matrix.tofile(vectors_tmp)
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({"model_id": model_id, "dim": int(matrix.shape[1]) if matrix.size else 0,
+                       "chunks": chunks}, f)
+        os.replace(vectors_tmp, os.path.join(index_dir, "vectors.f32"))
+        os.replace(meta_tmp, os.path.join(index_dir, "chunks.json"))
+
+    @classmethod
+    def open(cls, index_dir: str, embeddings) -> "RulesIndex":
+        with open(os.path.join(index_dir, "chunks.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["chunks"]:
+            vectors = np.memmap(os.path.join(index_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                                shape=(len(meta["chunks"]), meta["dim"]))
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        return cls(index_dir, embeddings, meta["model_id"], meta["chunks"], vectors)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Cosine similarity of ``query`` against every chunk"""
+        if not self.chunks:
+            return np.zeros(0, dtype=np.float32)
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector /= norm
+        return self.vectors @ query_vector
+
+    def search(self, query: str, k: int = 4) -> List[SearchHit]:
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            SearchHit(self.chunks[i]["text"], float(scores[i]), self.chunks[i]["metadata"])
+            for i in top
+        ]
+
+    def as_retriever(self, k: int = 4) -> "RulesRetriever":
+        return RulesRetriever(index=self, k=k)
+
+
+class RulesRetriever(BaseRetriever):
+    """LangChain retriever over a RulesIndex"""
+
+    index: RulesIndex
+    k: int = 4
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [
+            Document(page_content=hit.text, metadata={**hit.metadata, "score": hit.score})
+            for hit in self.index.search(query, self.k)
+        ]
+
+
+def default_embeddings():
+    """Cohere in production; RULES_EMBEDDINGS=hashing selects the offline stand-in"""
+    if os.environ.get("RULES_EMBEDDINGS", "cohere") == "hashing":
+        return HashingEmbeddings(), "hashing-512"
+    from langchain_cohere import CohereEmbeddings
+    return CohereEmbeddings(model="embed-english-v3.0"), "cohere-embed-english-v3.0"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the rules.md embedding index")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("text", nargs="?")
+    parser.add_argument("--rules", default=RULES_PATH)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    embeddings, model_id = default_embeddings()
+    index = RulesIndex.build(embeddings, model_id, rules_path=args.rules, index_dir=args.index_dir)
+    if args.command == "build":
+        print(f"{len(index.chunks)} chunk(s) indexed, {index.embedded_on_build} embedded")
+    else:
+        for hit in index.search(args.text or "", args.k):
+            print(f"{hit.score:.3f}  {hit.text[:100]!r}")
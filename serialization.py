@@ -0,0 +1,190 @@
+import math
+import types
+import typing
+from datetime import date, datetime, time
+from decimal import Decimal
+from json.encoder import encode_basestring
+
+from pydantic import BaseModel
+
+
+class _Fallback(Exception):
+    """Value is not in a shape the fast path handles; use the model instead"""
+
+
+def _int(value):
+    if type(value) is not int:
+        raise _Fallback
+    return str(value)
+
+
+def _str(value):
+    if type(value) is not str:
+        raise _Fallback
+    return encode_basestring(value)
+
+
+def _decimal(value):
+    # Mirrors pydantic: floats go through str() so 2.85 stays "2.85". For floats
+    # without an exponent repr() already is that string.
+    if type(value) is int:
+        return f'"{value}"'
+    if type(value) is float:
+        text = repr(value)
+        if 'e' in text or 'n' in text:
+            if not math.isfinite(value):
+                raise _Fallback
+            text = str(Decimal(text))
+        return f'"{text}"'
+    if type(value) is str:
+        try:
+            number = Decimal(value)
+        except ArithmeticError:
+            raise _Fallback
+        if not number.is_finite():
+            raise _Fallback
+        return f'"{number}"'
+    raise _Fallback
+
+
+def _memoized(convert, size: int = 4096):
+    """Bounded memo for string conversions; ledger dates and times repeat heavily"""
+    cache = {}
+
+    def cached(value: str) -> str:
+        text = cache.get(value)
+        if text is None:
+            text = convert(value)
+            if len(cache) >= size:
+                cache.clear()
+            cache[value] = text
+        return text
+
+    return cached
+
+
+def _parse_time(value: str) -> str:
+    parsed = time.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        raise _Fallback
+    return parsed.isoformat()
+
+
+_iso_date = _memoized(lambda value: date.fromisoformat(value).isoformat())
+_iso_time = _memoized(_parse_time)
+
+
+def _date(value):
+    if type(value) is not str:
+        raise _Fallback
+    return f'"{_iso_date(value)}"'
+
+
+def _time(value):
+    if type(value) is not str:
+        raise _Fallback
+    return f'"{_iso_time(value)}"'
+
+
+def _datetime(value):
+    if type(value) is not str:
+        raise _Fallback
+    if len(value) == 19 and value[10] in ' T':
+        return f'"{_iso_date(value[:10])}T{_iso_time(value[11:])}"'
+    if len(value) > 19 and value[10] in ' T':
+        # Fractional seconds are effectively unique, so skip the memo
+        return f'"{_iso_date(value[:10])}T{_parse_time(value[11:])}"'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        raise _Fallback
+    return f'"{parsed.isoformat()}"'
+
+
+_CONVERTERS = {
+    int: _int,
+    str: _str,
+    Decimal: _decimal,
+    date: _date,
+    time: _time,
+    datetime: _datetime,
+}
+
+
+class RowEncoder:
+    """Encode database rows straight to the JSON a pydantic model would produce.
+
+    Rows skip model construction, validation and the second pass FastAPI makes
+    through ``response_model``. For each column layout a small function is
+    generated (as ``dataclasses`` does for ``__init__``) that reads the columns by
+    position and formats one object with a single f-string. Any value the
+    converters don't recognise, or a row the model would reject, is encoded
+    through the model itself, so output and errors match the model path.
+    """
+
+    def __init__(self, model: typing.Type[BaseModel]):
+        self.model = model
+        self._fields = []
+        for name, field in model.model_fields.items():
+            annotation = field.annotation
+            nullable = False
+            if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+                args = [a for a in typing.get_args(annotation) if a is not type(None)]
+                nullable = len(args) < len(typing.get_args(annotation))
+                annotation = args[0] if len(args) == 1 else None
+            converter = _CONVERTERS.get(annotation)
+            if converter is None:
+                raise TypeError(f"{model.__name__}.{name}: unsupported type {field.annotation!r}")
+            self._fields.append((name, converter, nullable))
+        self._encoders = {}
+
+    def _fallback(self, row) -> str:
+        return self.model(**dict(row)).model_dump_json()
+
+    def _compile(self, columns: tuple):
+        position = {name: i for i, name in enumerate(columns)}
+        namespace = {"_Fallback": _Fallback, "fallback": self._fallback}
+        body = []
+        parts = []
+        for i, (name, converter, nullable) in enumerate(self._fields):
+            if name not in position:
+                # Missing column: let the model report it
+                return self._fallback
+            namespace[f"convert_{i}"] = converter
+            if nullable:
+                body.append(f"        v = row[{position[name]}]")
+                body.append(f"        f{i} = 'null' if v is None else convert_{i}(v)")
+            else:
+                body.append(f"        f{i} = convert_{i}(row[{position[name]}])")
+            parts.append(f'"{name}":{{f{i}}}')
+        source = "\n".join([
+            "def encode(row):",
+            "    try:",
+            *body,
+            "    except (_Fallback, ValueError, TypeError):",
+            "        return fallback(row)",
+            "    return f'{{" + ",".join(parts) + "}}'",
+        ])
+        exec(source, namespace)
+        return namespace["encode"]
+
+    def _encoder(self, row):
+        columns = tuple(row.keys())
+        encode = self._encoders.get(columns)
+        if encode is None:
+            encode = self._encoders[columns] = self._compile(columns)
+        return encode
+
+    def encode_row(self, row) -> str:
+        return self._encoder(row)(row)
+
+    def encode_rows(self, rows) -> bytes:
+        """JSON array of rows, as returned for ``response_model=List[model]``"""
+        if not rows:
+            return b"[]"
+        return ("[" + ",".join(map(self._encoder(rows[0]), rows)) + "]").encode()
+
+    def encode_ndjson(self, rows) -> bytes:
+        if not rows:
+            return b""
+        encode = self._encoder(rows[0])
+        return "".join([encode(r) + "\n" for r in rows]).encode()
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import time
+import uuid
+from typing import List, Optional
+
+from langchain_core.messages import AnyMessage, RemoveMessage, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+# Agent session configuration
+SESSIONS_DB_PATH = os.environ.get("AGENT_SESSIONS_DB_PATH", "agent_sessions.db")
+SESSION_TTL_SECONDS = float(os.environ.get("AGENT_SESSION_TTL_SECONDS", "3600"))
+MAX_SESSIONS = int(os.environ.get("AGENT_MAX_SESSIONS", "1000"))
+MAX_HISTORY_TOKENS = int(os.environ.get("AGENT_MAX_HISTORY_TOKENS", "4000"))
+EVICT_INTERVAL_SECONDS = 60.0
+
+
+def new_thread_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SessionStore:
+    """Disk-backed agent checkpoints with LRU/TTL eviction of idle sessions.
+
+    Checkpoints live in SQLite through langgraph's SqliteSaver, so conversation
+    state is not held in process memory. ``agent_sessions`` records when each
+    thread was last used; ``evict`` deletes the checkpoints of threads idle for
+    longer than ``ttl`` seconds and of the least recently used threads beyond
+    ``max_sessions``.
+    """
+
+    def __init__(self, database: str = SESSIONS_DB_PATH, ttl: float = SESSION_TTL_SECONDS,
+                 max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._conn = sqlite3.connect(database, check_same_thread=False)
+        self.checkpointer = SqliteSaver(self._conn)
+        self.checkpointer.setup()
+        # The checkpointer serialises its statements on this lock; the session
+        # queries share the connection, so they must take the same one
+        self._lock = self.checkpointer.lock
+        self._last_evicted = 0.0
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS agent_sessions (
+                    thread_id TEXT PRIMARY KEY,
+                    last_seen REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_agent_sessions_last_seen ON agent_sessions (last_seen)"
+            )
+            self._conn.commit()
+
+    def config(self, thread_id: str) -> dict:
+        """Run config for ``thread_id``; marks the session as used and evicts lazily"""
+        self.touch(thread_id)
+        if time.time() - self._last_evicted >= EVICT_INTERVAL_SECONDS:
+            self.evict()
+        return {"configurable": {"thread_id": thread_id}}
+
+    def touch(self, thread_id: str):
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO agent_sessions (thread_id, last_seen) VALUES (?, ?)
+                ON CONFLICT (thread_id) DO UPDATE SET last_seen = excluded.last_seen
+            """, (thread_id, time.time()))
+            self._conn.commit()
+
+    def evict(self, now: Optional[float] = None) -> List[str]:
+        """Delete expired and least recently used sessions. Returns their thread ids."""
+        now = now or time.time()
+        with self._lock:
+            self._last_evicted = now
+            expired = [r[0] for r in self._conn.execute("""
+                SELECT thread_id FROM agent_sessions WHERE last_seen < ?
+                UNION
+                SELECT thread_id FROM (
+                    SELECT thread_id FROM agent_sessions
+                    ORDER BY last_seen DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (now - self.ttl, self.max_sessions))]
+        for thread_id in expired:
+            self.checkpointer.delete_thread(thread_id)
+        with self._lock:
+            self._conn.executemany("DELETE FROM agent_sessions WHERE thread_id = ?",
+                                   [(t,) for t in expired])
+            self._conn.commit()
+        return expired
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def trim_history(messages: List[AnyMessage], max_tokens: int = MAX_HISTORY_TOKENS) -> List[AnyMessage]:
+    """Most recent messages that fit ``max_tokens``, starting on a human turn"""
+    return trim_messages(
+        messages,
+        strategy="last",
+        token_counter=count_tokens_approximately,
+        max_tokens=max_tokens,
+        start_on="human",
+        include_system=True,
+        allow_partial=False,
+    )
+
+
+def make_history_hook(max_tokens: int = MAX_HISTORY_TOKENS):
+    """``pre_model_hook`` for create_react_agent that keeps history within budget.
+
+    When the conversation is over budget the stored messages are replaced with
+    the trimmed ones, so both the prompt and the checkpoint stay bounded.
+    """
+    def hook(state: dict) -> dict:
+        messages = state["messages"]
+        trimmed = trim_history(messages, max_tokens)
+        # Nothing to drop, or a single turn already exceeds the budget
+        if not trimmed or len(trimmed) == len(messages):
+            return {}
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *trimmed]}
+
+    return hook
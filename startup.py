@@ -0,0 +1,91 @@
+import argparse
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Modules the chat app imports while it builds its resources
+APP_MODULES = (
+    "streamlit", "langchain_anthropic", "langchain_cohere", "agent", "rules_index",
+    "hybrid_retriever", "sessions", "tool_cache", "tool_provider",
+)
+# "import time: self [us] | cumulative | imported package" lines of python -X importtime
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+class StartupProfile:
+    """Wall time of the named startup stages of this process.
+
+    Modules outlive Streamlit reruns, so the module-level ``PROFILE`` records
+    the one cold start that built the cached resources; a stage entered again
+    adds to its total.
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stages[name] = self._stages.get(name, 0.0) + elapsed
+
+    def report(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: round(seconds, 3) for name, seconds in self._stages.items()}
+
+    def collector(self) -> Callable[[], Iterable[tuple]]:
+        """metrics.Registry collector exporting the stage times"""
+        def collect():
+            return [("agent_startup_seconds", "gauge", "Wall time of each startup stage of this process",
+                     {(("stage", name),): seconds for name, seconds in self.report().items()})]
+        return collect
+
+
+PROFILE = StartupProfile()
+
+
+def import_times(modules: Sequence[str] = APP_MODULES) -> List[Tuple[str, int, float, float]]:
+    """Import ``modules`` in a fresh interpreter under ``-X importtime``.
+
+    Returns ``(module, depth, self_seconds, cumulative_seconds)`` for every
+    module that was loaded, in import order; depth 0 are top-level imports,
+    including the interpreter's own start-up modules.
+    """
+    code = "; ".join(f"import {name}" for name in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    timings = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            timings.append((name, (len(indent) - 1) // 2, int(own) / 1e6, int(cumulative) / 1e6))
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time report for the chat app's modules")
+    parser.add_argument("modules", nargs="*", default=list(APP_MODULES))
+    parser.add_argument("--top", type=int, default=20, help="slowest nested imports to list")
+    args = parser.parse_args()
+
+    timings = import_times(args.modules)
+    requested = [t for t in timings if t[1] == 0 and t[0] in args.modules]
+    print(f"{'cumulative':>10}  {'self':>8}  module")
+    for name, _, own, cumulative in requested:
+        print(f"{cumulative:>9.3f}s  {own:>7.3f}s  {name}")
+    print(f"{sum(t[3] for t in requested):>9.3f}s  total\n")
+    print(f"Slowest {args.top} imports by self time:")
+    for name, depth, own, cumulative in sorted(timings, key=lambda t: t[2], reverse=True)[:args.top]:
+        print(f"{own:>9.3f}s  {'  ' * depth}{name}")
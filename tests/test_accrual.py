@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+
+import accrual
+from migrations import migrate
+
+ACCOUNT = "ACC-100000001"
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "bank.db")
+    migrate(conn)
+    conn.execute(
+        "INSERT INTO clients (client_name, account_number, interest_rate, tariff_type) VALUES (?, ?, ?, ?)",
+        ("Test Client", ACCOUNT, "0.05", "NORMAL"),
+    )
+    # Recorded after the day they belong to: each created_at falls in the next month
+    conn.executemany("""
+        INSERT INTO transactions (account_number, transaction_date, transaction_time, transaction_type,
+                                  amount, balance_after, channel, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, 'ONLINE', 'COMPLETED', ?)
+    """, [
+        (ACCOUNT, "2024-05-31", "23:50:00", "DEPOSIT", 1000, 1000, "2024-06-01 00:00:05"),
+        (ACCOUNT, "2024-06-16", "12:00:00", "DEPOSIT", 500, 1500, "2024-06-16 12:00:00"),
+        (ACCOUNT, "2024-06-30", "23:55:00", "WITHDRAWAL", -300, 1200, "2024-07-01 00:00:10"),
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_month_is_selected_by_transaction_date(conn):
+    start, end = accrual.month_bounds("2024-06")
+    balances = accrual.average_daily_balances(conn, [ACCOUNT], start, end)
+    counts, _ = accrual.monthly_activity(conn, [ACCOUNT], start, end)
+    # 15 days at 1000 (opening balance from May 31), 14 at 1500, June 30 at 1200
+    assert balances[0] == pytest.approx((15 * 1000 + 14 * 1500 + 1200) / 30)
+    assert counts[0] == 2
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+from db import ChangeFeed
+
+logger = logging.getLogger(__name__)
+
+# How often, at most, a cache checks the database for writes by other processes
+CHANGE_POLL_SECONDS = float(os.environ.get("AGENT_TOOL_CACHE_POLL_SECONDS", "0.25"))
+
+# Read-only tools from tools_sqlite.yaml and the table each one reads
+READ_TOOLS = {
+    "search-all-transactions": "transactions",
+    "search-all-transactions-by-account": "transactions",
+    "search-transactions-by-account-page": "transactions",
+    "search-by-status": "transactions",
+    "search-by-date-range": "transactions",
+    "search-transactions-by-text": "transactions",
+    "get-account-summary": "transactions",
+    "search-all-clients": "clients",
+    "search-client-number": "clients",
+    "search-account-number-by-name": "clients",
+}
+# Tools that write, and the table they change
+WRITE_TOOLS = {
+    "change-client-tariff": "clients",
+    "repeat-cancelled-transaction": "transactions",
+}
+
+
+def normalize_params(params: dict) -> str:
+    """Stable cache key for tool arguments: sorted keys, trimmed strings, no Nones"""
+    return json.dumps(
+        {k: v.strip() if isinstance(v, str) else v for k, v in params.items() if v is not None},
+        sort_keys=True, default=str,
+    )
+
+
+class ToolCache:
+    """Size-bounded LRU cache of read-only tool results.
+
+    Entries are keyed by tool name and normalized arguments and remember the
+    table they read and, for account-scoped calls, the account. A write to an
+    account drops that account's entries and every unscoped entry over the same
+    table (e.g. ``search-all-transactions``); entries whose scope is unknown can't
+    be matched more precisely. Writes by other processes, such as the bank API,
+    are picked up from the database's change feed once ``watch`` is called;
+    ``ttl`` remains a backstop.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._feed: Optional[ChangeFeed] = None
+
+    def watch(self, database: str, interval: float = CHANGE_POLL_SECONDS) -> bool:
+        """Invalidate on writes other processes make to ``database``.
+
+        Needs schema version 9 (``python migrations.py``); returns False, leaving
+        only the TTL, when the change feed is missing.
+        """
+        try:
+            self._feed = ChangeFeed(database, interval)
+        except sqlite3.OperationalError as exc:
+            logger.warning("tool cache not watching %s: %s", database, exc)
+            return False
+        return True
+
+    def refresh(self) -> int:
+        """Apply the writes the change feed reports; returns entries dropped"""
+        if self._feed is None:
+            return 0
+        changed = {}
+        for table, account in self._feed.poll():
+            changed.setdefault(table, set()).add(account)
+        return sum(self.invalidate(table, accounts) for table, accounts in changed.items())
+
+    def get(self, key):
+        self.refresh()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[3] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value, table: str, account: Optional[str]):
+        with self._lock:
+            self._entries[key] = (value, table, account, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table: str, accounts: Optional[Iterable[str]] = None) -> int:
+        """Drop entries over ``table`` for ``accounts`` (all of them when None)"""
+        accounts = None if accounts is None else set(accounts)
+        with self._lock:
+            stale = [
+                key for key, (_, entry_table, account, _) in self._entries.items()
+                if entry_table == table and (accounts is None or account is None or account in accounts)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def ledger_listener(self, rows: List) -> None:
+        """LedgerWriter listener: invalidate the accounts a committed batch touched"""
+        if rows:
+            self.invalidate("transactions", {row["account_number"] for row in rows})
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    # Tool wrapping
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """Read-through wrapper for read tools, invalidating wrapper for write tools.
+
+        Other tools are returned unchanged.
+        """
+        if tool.name in READ_TOOLS:
+            table = READ_TOOLS[tool.name]
+
+            def lookup(params: dict):
+                key = (tool.name, normalize_params(params))
+                return key, self.get(key)
+
+            def store(key, params: dict, value):
+                self.put(key, value, table, params.get("account_number"))
+                return value
+
+            def run(**params):
+                key, entry = lookup(params)
+                return entry[0] if entry else store(key, params, tool.invoke(params))
+
+            async def arun(**params):
+                key, entry = lookup(params)
+                return entry[0] if entry else store(key, params, await tool.ainvoke(params))
+
+        elif tool.name in WRITE_TOOLS:
+            table = WRITE_TOOLS[tool.name]
+
+            def invalidate(params: dict):
+                account = params.get("account_number")
+                self.invalidate(table, [account] if account else None)
+
+            def run(**params):
+                try:
+                    return tool.invoke(params)
+                finally:
+                    invalidate(params)
+
+            async def arun(**params):
+                try:
+                    return await tool.ainvoke(params)
+                finally:
+                    invalidate(params)
+        else:
+            return tool
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            func=run,
+            coroutine=arun,
+        )
+
+    def wrap_all(self, tools: Iterable[BaseTool]) -> List[BaseTool]:
+        return [self.wrap(tool) for tool in tools]
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import yaml
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import Field, create_model
+
+import archive
+import ledger
+from db import ConnectionPool
+from monitor import TransactionMonitor
+
+# Toolbox parameter types and the Python types they validate as
+PARAMETER_TYPES = {"string": str, "integer": int, "float": float, "boolean": bool}
+# Toolbox binds $N positionally; sqlite3 spells that ?N
+_POSITIONAL = re.compile(r"\$(\d+)")
+_READ_PREFIXES = ("SELECT", "WITH")
+# Tools whose results include archived months: name -> fn(conn, rows, *values)
+CROSS_TIER = {"search-by-date-range": archive.with_date_range}
+
+
+def _write(conn, statement: str, params: dict, monitor: Optional[TransactionMonitor]):
+    return conn.execute(statement, list(params.values())).fetchall()
+
+
+def repeat_transaction(conn, statement: str, params: dict, monitor: Optional[TransactionMonitor]):
+    """repeat-cancelled-transaction, posted the way ``POST /transactions/batch`` posts.
+
+    Same result as the yaml statement: the balance comes from the ledger and a
+    debit that would overdraw is recorded as FAILED (INSUFFICIENT_FUNDS). The
+    monitor's limits apply on top, as for every in-process write.
+    """
+    if monitor is None:
+        monitor = TransactionMonitor()
+        monitor.load(conn, accounts=[params["account_number"]])
+    now = datetime.now()
+    result = ledger.post_transactions(conn, [params], now=now, monitor=monitor)[0]
+    transaction_id = result.get("transaction_id")
+    if transaction_id is None:
+        transaction_id = conn.execute("""
+            INSERT INTO transactions (
+                account_number, transaction_date, transaction_time, transaction_type, amount,
+                balance_after, description, reference_number, counterparty_account, counterparty_name,
+                channel, location, status, failure_reason, created_at
+            ) VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, 'FAILED', 'INSUFFICIENT_FUNDS', ?)
+        """, (
+            params["account_number"], now.date().isoformat(), now.time().isoformat(),
+            params["transaction_type"], params["amount"], params["description"], params["reference_number"],
+            params["counterparty_account"], params["counterparty_name"], params["channel"],
+            params["location"], now,
+        )).lastrowid
+    return conn.execute("""
+        SELECT transaction_id, status, balance_after, failure_reason, created_at
+        FROM transactions WHERE transaction_id = ?
+    """, (transaction_id,)).fetchall()
+
+
+def change_tariff(conn, statement: str, params: dict, monitor: Optional[TransactionMonitor]):
+    """change-client-tariff; the monitor's limits for the client follow the change"""
+    rows = _write(conn, statement, params, monitor)
+    if monitor is not None:
+        accounts = [row[0] for row in conn.execute(
+            "SELECT account_number FROM clients WHERE client_name_norm = lower(trim(?))", (params["client_name"],)
+        )]
+        monitor.reload_clients(conn, accounts)
+    return rows
+
+
+# Write tools run as LedgerWriter ops: name -> fn(conn, statement, params, monitor)
+WRITE_OPS = {
+    "repeat-cancelled-transaction": repeat_transaction,
+    "change-client-tariff": change_tariff,
+}
+
+
+def _args_schema(name: str, parameters: List[dict]) -> type:
+    """Pydantic model for a tool's parameters; all required, like Toolbox"""
+    fields = {
+        p["name"]: (PARAMETER_TYPES[p.get("type", "string")], Field(..., description=p.get("description", "")))
+        for p in parameters
+    }
+    return create_model(name.replace("-", "_"), **fields)
+
+
+def _encode(rows) -> str:
+    return json.dumps([dict(row) for row in rows], default=str)
+
+
+class ToolProvider:
+    """LangChain tools built from tools_sqlite.yaml and run in-process.
+
+    Each ``sqlite-sql`` tool becomes a StructuredTool with the same parameters,
+    types and positional binding the Toolbox server uses, executed on a
+    ConnectionPool instead of over HTTP. Pass ``bank_api.get_pool()``,
+    ``bank_api.get_writer()`` and ``bank_api.get_monitor()`` to share the API's
+    connections, writer and limit checks when both run in one process. Read
+    statements run on any pooled connection; write statements run as ops of a
+    LedgerWriter, through WRITE_OPS where the tool has one. The tools in
+    CROSS_TIER also read the archived months.
+    """
+
+    def __init__(self, tools_file: str = "tools_sqlite.yaml", pool: Optional[ConnectionPool] = None,
+                 pool_size: int = 4, writer: Optional[ledger.LedgerWriter] = None,
+                 monitor: Optional[TransactionMonitor] = None):
+        with open(tools_file, encoding="utf-8") as f:
+            self.config = yaml.safe_load(f)
+        self._shared_pool = pool
+        self.pool_size = pool_size
+        self._pools: Dict[str, ConnectionPool] = {}
+        self._shared_writer = writer
+        self._writers: Dict[str, ledger.LedgerWriter] = {}
+        self.monitor = monitor
+
+    def pool(self, source: str) -> ConnectionPool:
+        if self._shared_pool is not None:
+            return self._shared_pool
+        if source not in self._pools:
+            spec = self.config["sources"][source]
+            if spec.get("kind") != "sqlite":
+                raise ValueError(f"Source {source!r} is {spec.get('kind')!r}; only sqlite runs in-process")
+            self._pools[source] = ConnectionPool(spec["database"], size=self.pool_size)
+        return self._pools[source]
+
+    def writer(self, source: str) -> ledger.LedgerWriter:
+        if self._shared_writer is not None:
+            return self._shared_writer
+        if source not in self._writers:
+            writer = self._writers[source] = ledger.LedgerWriter(self.config["sources"][source]["database"])
+            if self.monitor is not None:
+                writer.subscribe(self.monitor.ledger_listener, self.monitor.savepoint)
+        return self._writers[source]
+
+    def sql_tool(self, name: str) -> BaseTool:
+        spec = self.config["tools"][name]
+        if spec.get("kind") != "sqlite-sql":
+            raise ValueError(f"Tool {name!r} is {spec.get('kind')!r}; only sqlite-sql runs in-process")
+        parameters = spec.get("parameters") or []
+        names = [p["name"] for p in parameters]
+        statement = _POSITIONAL.sub(r"?\1", spec["statement"].strip())
+        read_only = statement.upper().startswith(_READ_PREFIXES)
+        pool = self.pool(spec["source"])
+        cross_tier = CROSS_TIER.get(name)
+
+        def execute(conn, values):
+            rows = conn.execute(statement, values).fetchall()
+            if cross_tier is not None:
+                rows = cross_tier(conn, rows, *values)
+            return _encode(rows)
+
+        if read_only:
+            def run(**params):
+                with pool.connection() as conn:
+                    return execute(conn, [params[n] for n in names])
+
+            async def arun(**params):
+                return await pool.run(execute, [params[n] for n in names])
+        else:
+            writer = self.writer(spec["source"])
+            op = WRITE_OPS.get(name, _write)
+
+            def run(**params):
+                return _encode(writer.run(op, statement, {n: params[n] for n in names}, self.monitor))
+
+            async def arun(**params):
+                return await asyncio.to_thread(run, **params)
+
+        return StructuredTool(
+            name=name,
+            description=spec.get("description", "").strip(),
+            args_schema=_args_schema(name, parameters),
+            func=run,
+            coroutine=arun,
+        )
+
+    def balance_tool(self) -> BaseTool:
+        """``GET /account/{account_number}/balance`` of bank_api, from the projection"""
+        pool = self.pool(next(iter(self.config["sources"])))
+
+        def query(conn, account_number: str) -> str:
+            row = ledger.current_balance(conn, account_number)
+            if row is None:
+                return json.dumps({"error": "Account not found or no completed transactions"})
+            # Same fields as BalanceResponse; available equals current (no holds)
+            return json.dumps({
+                "account_number": account_number,
+                "current_balance": str(row["balance"]),
+                "available_balance": str(row["balance"]),
+                "last_updated": row["updated_at"],
+            })
+
+        def run(account_number: str) -> str:
+            with pool.connection() as conn:
+                return query(conn, account_number)
+
+        async def arun(account_number: str) -> str:
+            return await pool.run(query, account_number)
+
+        return StructuredTool(
+            name="get-account-balance",
+            description="Current balance of an account, as shown by the bank API.",
+            args_schema=_args_schema("get-account-balance", [
+                {"name": "account_number", "type": "string",
+                 "description": "Client's account_number which can be retreived from table of clients."},
+            ]),
+            func=run,
+            coroutine=arun,
+        )
+
+    def load_toolset(self, name: Optional[str] = None) -> List[BaseTool]:
+        """Tools of toolset ``name`` (every toolset when None) plus the bank_api tools"""
+        toolsets = self.config.get("toolsets") or {}
+        if name is not None:
+            names = toolsets[name]
+        elif toolsets:
+            names = list(dict.fromkeys(n for tools in toolsets.values() for n in tools))
+        else:
+            names = list(self.config["tools"])
+        return [self.sql_tool(n) for n in names] + [self.balance_tool()]
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        for pool in self._pools.values():
+            pool.close()
+        self._pools.clear()